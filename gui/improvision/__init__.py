@@ -7,8 +7,16 @@
 # (at your option) any later version.
 
 
-from .improvisiontool import IMproVisionTool
-
 __all__ = [
     "IMproVisionTool",
 ]
+
+
+def __getattr__(name):
+    # the GTK tool is imported lazily: worker processes (see procpool) import this
+    # package to run the analysis kernels and must not load GTK
+    if name == "IMproVisionTool":
+        from .improvisiontool import IMproVisionTool
+
+        return IMproVisionTool
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
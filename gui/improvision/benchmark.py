@@ -0,0 +1,249 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Headless benchmarks of the IMproVision analysis path
+
+Feeds synthetic scanlines to the consumer, renderer and player logic and reports the
+steps per second of each stage as JSON. A previous report can be passed with --compare
+to flag the stages that got slower.
+
+Usage: python -m gui.improvision.benchmark --height 1080 -o bench.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from .event import Event, Note
+from .kernels import luma_playpoints, range_playpoints, range_params
+from .output import EventPlayer
+from .scanline import ScanlineFrame
+from .tables import SCALES, diatonic_table, control_table
+
+DISTRIBUTIONS = ("blank", "blocks", "stripes", "noise")
+
+
+def synthetic_columns(count, height, distribution="blocks", seed=0) -> np.ndarray:
+    """
+    generate scanline colors
+    :param distribution: "blank" (white paper), "blocks" (a few solid color strokes),
+                         "stripes" (a run every 8 pixels) or "noise" (random pixels)
+    :return (count, height, 3) float32 array of rgb values
+    """
+    rng = np.random.default_rng(seed)
+    columns = np.ones((count, height, 3), dtype=np.float32)
+    if distribution == "blocks":
+        for c in range(count):
+            for _ in range(4):
+                top = rng.integers(0, height)
+                size = rng.integers(1, max(2, height // 8))
+                columns[c, top : top + size] = rng.random(3)
+    elif distribution == "stripes":
+        colors = rng.random((count, (height + 7) // 8, 3)).astype(np.float32)
+        columns[:, 0::8] = colors[:, : len(range(0, height, 8))]
+        columns[:, 1::8] = colors[:, : len(range(1, height, 8))]
+    elif distribution == "noise":
+        columns[:] = rng.random(columns.shape)
+    elif distribution != "blank":
+        raise ValueError("unknown distribution '{}'".format(distribution))
+    return columns
+
+
+class NullPlayer(EventPlayer):
+    """
+    player counting the messages it would send, isolates EventPlayer.play diffing
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.messages = 0
+
+    def notes_on(self, notes):
+        self.messages += len(notes)
+
+    def notes_off(self, notes):
+        self.messages += len(notes)
+
+    def send_cc(self, control):
+        self.messages += 1
+
+    def send_pc(self, program):
+        self.messages += 1
+
+
+def _best_time(func, inputs, repeat):
+    """
+    :param inputs: callable returning the fresh inputs of a run
+    :return the best wall time of repeat runs of func(inputs())
+    """
+    best = None
+    for _ in range(repeat):
+        data = inputs()
+        start = time.perf_counter()
+        func(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(height=1080, count=500, distribution="blocks", repeat=5, seed=0) -> dict:
+    """
+    :return {"config": benchmark parameters, "results": stage -> {steps_per_second,
+            us_per_step}}
+    """
+    columns = synthetic_columns(count, height, distribution, seed)
+
+    def frames():
+        # frames memoize their planes, each run needs new ones
+        return [ScanlineFrame(c) for c in columns]
+
+    # same ranges of the IMproVision default color consumers
+    limits = {
+        "target": 0,
+        "targetdelta": 0.01,
+        "xmin": 0.8,
+        "xmax": 1,
+        "ymin": 0.4,
+        "ymax": 0.6,
+    }
+    hsvrange = range_params(dict(limits, type="HSV", refval="hue", xref="saturation"))
+    rgbrange = range_params(dict(limits, type="RGB", refval="red", xref="green"))
+    notes = diatonic_table(Note("C2"), 5, SCALES["major pentatonic"])
+    controls = control_table(7, 0, 127)
+
+    # renderers and players are fed with the playpoints/events of the real analysis
+    playpoints = [
+        pp for f in frames() for pp in range_playpoints(f, **rgbrange)[0]
+    ] or np.linspace(0, 1, count).tolist()
+    events = []
+    for f in frames():
+        event = Event()
+        for val in luma_playpoints(f, 0, 0.5)[0]:
+            event.merge(Event(notes=[notes[val]]))
+        for val in range_playpoints(f, **hsvrange)[1]:
+            event.merge(Event(controls=[controls[val]]))
+        events.append(event)
+
+    def consume(process):
+        return lambda data: [process(f) for f in data]
+
+    stages = {
+        "luma_consumer": (
+            consume(lambda f: luma_playpoints(f, 0, 0.1)),
+            frames,
+            count,
+        ),
+        "hsv_color_consumer": (
+            consume(lambda f: range_playpoints(f, **hsvrange)),
+            frames,
+            count,
+        ),
+        "rgb_color_consumer": (
+            consume(lambda f: range_playpoints(f, **rgbrange)),
+            frames,
+            count,
+        ),
+        "diatonic_renderer": (
+            lambda data: [Event(notes=[notes[v]]) for v in data],
+            lambda: playpoints,
+            len(playpoints),
+        ),
+        "control_change_renderer": (
+            lambda data: [Event(controls=[controls[v]]) for v in data],
+            lambda: playpoints,
+            len(playpoints),
+        ),
+        "player_diffing": (
+            lambda data: [data.play(e) for e in events],
+            NullPlayer,
+            len(events),
+        ),
+    }
+
+    results = {}
+    for name, (func, inputs, steps) in stages.items():
+        elapsed = _best_time(func, inputs, repeat)
+        results[name] = {
+            "steps_per_second": steps / elapsed if elapsed > 0 else float("inf"),
+            "us_per_step": elapsed / max(1, steps) * 1e6,
+        }
+    return {
+        "config": {
+            "height": height,
+            "count": count,
+            "distribution": distribution,
+            "repeat": repeat,
+            "seed": seed,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance) -> [str]:
+    """
+    :param tolerance: allowed slowdown, as a fraction of the baseline speed
+    :return the names of the stages slower than the baseline beyond tolerance
+    """
+    slower = []
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        if result["steps_per_second"] < base["steps_per_second"] * (1 - tolerance):
+            slower.append(name)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m gui.improvision.benchmark",
+        description="Benchmark the IMproVision analysis path on synthetic scanlines",
+    )
+    parser.add_argument("--height", type=int, default=1080, help="scanline height")
+    parser.add_argument("--count", type=int, default=500, help="scanlines per run")
+    parser.add_argument(
+        "--distribution", choices=DISTRIBUTIONS, default="blocks", help="scanline colors"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="runs, the best is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write the report here (default stdout)")
+    parser.add_argument("--compare", help="previous report to compare the results with")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed slowdown (default 0.2)"
+    )
+    args = parser.parse_args(argv)
+
+    report = run(args.height, args.count, args.distribution, args.repeat, args.seed)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            report["slower"] = compare(report, json.load(f), args.tolerance)
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if report.get("slower"):
+        print(
+            "slower than baseline: {}".format(", ".join(report["slower"])),
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
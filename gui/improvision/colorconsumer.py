@@ -7,13 +7,10 @@
 # (at your option) any later version.
 
 
-import threading
-import queue
-
 from lib.gibindings import Gtk
 from .eventrenderer import EventRenderer
 from .event import Event
-from .player import EventPlayer
+from .output import EventPlayer
 from .configurable import (
     Configurable,
     Configuration,
@@ -23,14 +20,16 @@ from .configurable import (
     BoolConfiguration,
 )
 from .colorrange import ColorRangeConfiguration, ThreeValueColorRange
+from .scanline import ScanlineFrame
+from .kernels import luma_playpoints, range_playpoints
+from .timeline import EventTimeline
+from .latency import recorder
 from gui.colors.sliders import HCYLumaSlider
 
-from lib import color
-
 _consumers_ids = [0]
 
 
-class ColorConsumer(threading.Thread, Configurable):
+class ColorConsumer(Configurable):
     """
     base consumer class, implements top level processing logic
 
@@ -44,10 +43,21 @@ class ColorConsumer(threading.Thread, Configurable):
     the process data should generate a list of play points for each active renderer, these
     points are then passed to the renderers and the output generated from the renderers is
     merged and sent to all the known players for actual output
+
+    consumers don't own a thread, scanlines are broadcast to all of them through a
+    pipeline.FrameRing, whose worker threads call consume() with each new scanline
+
+    when replaying a static drawing, the merged output of each column is cached in the
+    consumer timeline and the analysis is skipped for the columns that didn't change
+
+    if kernel_pool is set, the process_data kernel (see get_kernel) runs in a worker
+    process instead of the consumer thread
     """
 
+    # procpool.KernelPool, shared by all the consumers
+    kernel_pool = None
+
     def __init__(self, renderers: [EventRenderer], players: [EventPlayer]):
-        threading.Thread.__init__(self, daemon=True)
         self.renderers = renderers
         if type(players) is list:
             self.players = players
@@ -58,12 +68,25 @@ class ColorConsumer(threading.Thread, Configurable):
         enabled = BoolConfiguration("Enabled", "enabled", True)
         Configurable.__init__(
             self,
-            confmap={"enabled": enabled},
+            confmap={
+                "enabled": enabled,
+                "input_policy": ListConfiguration(
+                    "When behind",
+                    "input_policy",
+                    "Skip to latest",
+                    {
+                        "Skip to latest": "latest",
+                        "Drop oldest": "bounded",
+                        "Wait": "block",
+                    },
+                ),
+            },
             subconfigs=self.players + self.renderers,
             removable=True,
         )
-        self.queue = queue.SimpleQueue()
-        self._should_exit = False
+        # pipeline.RingReader, set when the consumer is attached to a FrameRing
+        self.reader = None
+        self.timeline = EventTimeline()
 
         def toggle_enabled(t):
             if not t.get_active():
@@ -71,43 +94,95 @@ class ColorConsumer(threading.Thread, Configurable):
 
         enabled.toggle.connect("toggled", toggle_enabled)
 
-    def run(self) -> None:
-        while not self._should_exit:
-            event = Event()
-            data = self.queue.get(True, None)
-            if self._should_exit:
-                break
-            playpoints_list = self.process_data(data)
+    def consume(self, item):
+        """
+        process a scanline published on the FrameRing
+        :param item: (frame, column), frame is the scanline data, it may be None if
+                     column is cached in the timeline, if column is not None the cached
+                     timeline event for this column is replayed (analyzing frame only if
+                     the event is missing)
+        """
+        frame, column = item
+        event = None
+        if column is not None:
+            generation = self.timeline.generation
+            event = self.timeline.get(column)
+            if event is None and frame is not None:
+                event = self.analyze(frame)
+                self.timeline.store(column, event, generation)
+        elif frame is not None:
+            event = self.analyze(frame)
+        self.emit(event if event is not None else Event())
+
+    def analyze(self, frame: ScanlineFrame) -> Event:
+        """
+        process a scanline and render the resulting playpoints
+        :return the merged output of all the renderers
+        """
+        event = Event()
+        with recorder.measure("process"):
+            pool = self.kernel_pool
+            if pool is not None:
+                kernel, params = self.get_kernel()
+                playpoints_list = pool.run(frame, kernel, params)
+            else:
+                playpoints_list = self.process_data(frame)
+        with recorder.measure("renderer"):
             for r in range(min(len(self.renderers), len(playpoints_list))):
                 # avoid errors, if too few renderers or playpoints are available only process what we can
                 event.merge(self.renderers[r].render(playpoints_list[r]))
+        return event
+
+    def emit(self, event: Event):
+        with recorder.measure("play"):
             for p in self.players:
                 p.play(event)
-        self.stop()
+
+    @property
+    def plane(self):
+        """
+        name of the ScanlineFrame plane read by the kernel, see ScanlineFrame.converters
+        """
+        return "rgb"
+
+    def get_analysis_key(self):
+        """
+        :return the configuration values analyze() output depends on
+        """
+        values = [dict(c.get_values()) for c in [self] + self.renderers]
+        # the input policy only affects which columns are analyzed
+        values[0].pop("input_policy", None)
+        return values
 
     def stop(self):
         for p in self.players:
             p.stop()
 
-    def data_ready(self, color_column):
-        if self.enabled:
-            self.queue.put(color_column, False)
-
     def remove(self, _):
         super().remove(_)
         self.enabled = False
-        self._should_exit = True
-        self.data_ready([])
+        if self.reader is not None:
+            self.reader.detach()
+            self.reader = None
         self.stop()
 
-    # subclasses must implement this method
-    def process_data(self, color_column) -> [[float]]:
+    def process_data(self, frame: ScanlineFrame) -> [[float]]:
         """
         process a scanline
-        :param color_column: a list of pixel data reflecting the currently processed scanline
+        :param frame: pixel data of the currently processed scanline, the same frame is
+                      shared by all the consumers and must not be modified
         :return a list of lists of float, each inner element is a single play point (0~1),
                 each list of play points is meant for the renderer at the same index
         """
+        kernel, params = self.get_kernel()
+        return kernel(frame, **params)
+
+    # subclasses must implement this method
+    def get_kernel(self):
+        """
+        :return (kernel, params), kernel is a module level function (see kernels) called as
+                kernel(frame, **params) to implement process_data, params must be picklable
+        """
         raise NotImplementedError
 
 
@@ -151,29 +226,12 @@ class LumaConsumer(ColorConsumer, Configurable):
             },
         )
 
-    def process_data(self, color_column) -> [[float]]:
-        playpoints = []
-        window = 0
-        windowsize = 0
-        maxv = len(color_column)
-        if self.minluma <= self.maxluma:
-            minluma = self.minluma
-            maxluma = self.maxluma
-        else:
-            minluma = self.maxluma
-            maxluma = self.minluma
-        for y in range(maxv):
-            luma = color_column[y].get_luma()
-            if minluma <= luma <= maxluma:
-                window += y
-                windowsize += 1
-            else:
-                if windowsize > 0:
-                    playpoints.append(1 - ((window / windowsize) / maxv))
-                    window = 0
-                    windowsize = 0
+    @property
+    def plane(self):
+        return "luma"
 
-        return [playpoints]
+    def get_kernel(self):
+        return luma_playpoints, {"minluma": self.minluma, "maxluma": self.maxluma}
 
 
 class ThreeValueColorConsumer(ColorConsumer, Configurable):
@@ -209,31 +267,9 @@ class ThreeValueColorConsumer(ColorConsumer, Configurable):
             },
         )
 
-    def process_data(self, color_column: [color.RGBColor]):
-        hplaypoints = []
-        xplaypoints = []
-        yplaypoints = []
+    @property
+    def plane(self):
+        return self.colorrange.plane
 
-        window = [0, 0, 0]
-        windowsize = 0
-
-        cr = self.colorrange
-
-        maxv = len(color_column)
-        for y in range(maxv):
-            match, xv, yv = cr.in_range(color_column[y])
-
-            if match:
-                window[0] += y
-                window[1] += xv
-                window[2] += yv
-                windowsize += 1
-            else:
-                if windowsize > 0:
-                    hplaypoints.append(1 - ((window[0] / windowsize) / maxv))
-                    xplaypoints.append(window[1] / windowsize)
-                    yplaypoints.append(window[2] / windowsize)
-                    window[0] = window[1] = window[2] = 0
-                    windowsize = 0
-
-        return [hplaypoints, xplaypoints, yplaypoints]
+    def get_kernel(self):
+        return range_playpoints, self.colorrange.get_kernel_params()
@@ -27,9 +27,13 @@ from gui.colors.util import draw_marker_circle, clamp
 from functools import partial
 from lib.color import RGBColor, HSVColor
 from .utils import map_to_percent, map_to_range
+from .kernels import range_params
 
 
 class ThreeValueColorRange(dict):
+    # name of the ScanlineFrame plane holding colors in this range color space
+    plane = None
+
     def __init__(
         self,
         refval: str,
@@ -171,6 +175,13 @@ class ThreeValueColorRange(dict):
         :param color: input color as a three value tuple
         :return (in_range, x_percent, y_percent)
         """
+        return self.in_range_values(color)
+
+    def in_range_values(self, color: (float, float, float)) -> (bool, float, float):
+        """
+        :param color: input color as a three value sequence, already in this range color space
+        :return (in_range, x_percent, y_percent)
+        """
         x = color[self.xid]
         y = color[self.yid]
         if (
@@ -185,6 +196,12 @@ class ThreeValueColorRange(dict):
             )
         return False, 0, 0
 
+    def get_kernel_params(self) -> {str: object}:
+        """
+        :return the range as plain kernels.range_playpoints() parameters
+        """
+        return range_params(self)
+
     def __str__(self):
         return "{}: {} (D: {}), {}: {}~{}, {}: {}~{}".format(
             self.refval,
@@ -216,6 +233,7 @@ class ThreeValueColorRange(dict):
 
 class HSVColorRange(ThreeValueColorRange):
     type = "HSV"
+    plane = "hsv"
     base_color = HSVColor(0, 1, 1)
     references = {
         "hue": (0, HSVHueSlider),
@@ -224,7 +242,7 @@ class HSVColorRange(ThreeValueColorRange):
     }
 
     def in_range(self, color: color.UIColor) -> (bool, float, float):
-        return super().in_range(color.get_hsv())
+        return self.in_range_values(color.get_hsv())
 
     @property
     def h(self):
@@ -244,6 +262,7 @@ class HSVColorRange(ThreeValueColorRange):
 
 class RGBColorRange(ThreeValueColorRange):
     type = "RGB"
+    plane = "rgb"
     base_color = RGBColor(0, 0, 0)
     references = {
         "red": (0, RGBRedSlider),
@@ -252,7 +271,7 @@ class RGBColorRange(ThreeValueColorRange):
     }
 
     def in_range(self, color: color.UIColor) -> (bool, float, float):
-        return super().in_range(color.get_rgb())
+        return self.in_range_values(color.get_rgb())
 
     @property
     def r(self):
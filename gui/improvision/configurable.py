@@ -7,10 +7,17 @@
 # (at your option) any later version.
 
 
+import itertools
+from types import MappingProxyType
+
 from lib.gibindings import Gtk
 from lib.gettext import gettext as _
 from gui.colors.adjbases import SliderColorAdjuster, PREFS_KEY_CURRENT_COLOR
 from gui.colors import ColorManager
+from lib.observable import event
+
+# shared by all the configurables, so every published snapshot has a distinct version
+_snapshot_versions = itertools.count(1)
 
 
 class Configuration:
@@ -40,6 +47,11 @@ class Configuration:
 
     def _set_value(self, val):
         self.app.preferences[self.pref_path] = val
+        self.value_changed()
+
+    @event
+    def value_changed(self):
+        """Event: the value was changed from the GUI"""
 
     def remove(self):
         if self._label is not None:
@@ -230,8 +242,16 @@ class Configurable(object):
     a configurable item is something that will hold a mix of configurations and other configurable items
 
     these isntances are used to group features together and to automatically generate preference paths
+
+    once the configurations are set up, their values are read from an immutable snapshot,
+    republished by the GTK thread each time one of them changes: worker threads reading
+    the values as attributes never touch the widgets
     """
 
+    _snapshot = None
+    # version of the current snapshot, 0 if nothing was published yet
+    settings_version = 0
+
     def __init__(
         self,
         label: str = None,
@@ -287,6 +307,7 @@ class Configurable(object):
                 self._confmap = confmap
             else:
                 self._confmap.update(confmap)
+            self._observe_configurations(confmap)
 
         self._remove_btn = None
         self._expander = None
@@ -294,6 +315,23 @@ class Configurable(object):
     def add_configurations(self, confmap: {str: Configuration}):
         if confmap is not None:
             self._confmap.update(confmap)
+            self._observe_configurations(confmap)
+
+    def _observe_configurations(self, confmap: {str: Configuration}):
+        for c in confmap.values():
+            c.value_changed += self._configuration_changed_cb
+
+    def _configuration_changed_cb(self, conf):
+        if self._snapshot is not None:
+            self.publish_values()
+        self.configuration_changed()
+
+    def configuration_changed(self):
+        """
+        called (from the GTK thread) after any of the configurations directly held by this
+        item changed, subclasses can override it to refresh the data they derive from them
+        """
+        pass
 
     def get_prefpath(self):
         ppath = ""
@@ -306,11 +344,32 @@ class Configurable(object):
         return ppath + self._subid
 
     def __getattr__(self, item):
+        snapshot = object.__getattribute__(self, "_snapshot")
+        if snapshot is not None and item in snapshot:
+            return snapshot[item]
         cm = object.__getattribute__(self, "_confmap")
         if item in cm:
             return cm[item].get_value()
         raise AttributeError
 
+    def publish_values(self):
+        """
+        snapshot the current configuration values (must be called from the GTK thread)
+        """
+        self._snapshot = MappingProxyType(
+            {name: c.get_value() for name, c in self._confmap.items()}
+        )
+        self.settings_version = next(_snapshot_versions)
+
+    def get_values(self) -> {str: object}:
+        """
+        :return the current value of each configuration directly held by this item, the
+                returned mapping must not be modified
+        """
+        if self._snapshot is not None:
+            return self._snapshot
+        return {name: c.get_value() for name, c in self._confmap.items()}
+
     def remove(self, _):
         for c in self._confmap.values():
             c.remove()
@@ -326,6 +385,7 @@ class Configurable(object):
     def add_to_grid(self, grid, row):
         for c in self._confmap.values():
             c.setup_preference(self.get_prefpath())
+        self.publish_values()
 
         outgrid = grid
         outrow = row
@@ -0,0 +1,381 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Headless IMproVision engine
+
+Runs the scanline -> consumer -> renderer -> player chain on a document loaded from
+an OpenRaster file, without any GUI. Consumers are described by plain dicts (loadable
+from JSON), e.g.:
+
+    {
+        "type": "luma",  # or "color", with a "range" dict, see kernels.range_params
+        "minluma": 0,
+        "maxluma": 0.1,
+        "channel": 1,
+        "renderers": [
+            {"type": "diatonic", "fundamental": "A1", "range": 3,
+             "scale": "minor pentatonic"},
+        ],
+    }
+
+Usage: python -m gui.improvision.engine drawing.ora -o drawing.mid
+
+when only writing a file the scan runs in virtual time, as fast as the analysis allows
+"""
+
+import argparse
+import json
+import math
+import threading
+import time
+from functools import partial
+
+from lib.document import Document
+from lib.tiledsurface import TILE_SIZE
+from .event import Event, Note
+from .kernels import luma_playpoints, range_playpoints, range_params
+from .latency import recorder
+from .midibackend import get_backend_names
+from .output import PortMidiPlayer, MidiFilePlayer
+from .sampler import ScanlineSampler
+from .scanline import ScanlineFrame
+from .scheduler import ScanlineClock
+from .smf import MidiFileWriter
+from .tables import SCALES, chromatic_table, diatonic_table, control_table
+
+# same setup as the IMproVision defaults
+DEFAULT_CONSUMERS = [
+    {
+        "type": "luma",
+        "minluma": 0,
+        "maxluma": 0.1,
+        "channel": 1,
+        "renderers": [
+            {
+                "type": "diatonic",
+                "fundamental": "A1",
+                "range": 3,
+                "scale": "minor pentatonic",
+            },
+        ],
+    },
+    {
+        "type": "color",
+        "range": {
+            "type": "HSV",
+            "refval": "hue",
+            "target": 0,
+            "targetdelta": 0.01,
+            "xref": "saturation",
+            "xmin": 0.8,
+            "xmax": 1,
+            "ymin": 0.4,
+            "ymax": 0.6,
+        },
+        "channel": 2,
+        "renderers": [
+            {
+                "type": "diatonic",
+                "fundamental": "C2",
+                "range": 5,
+                "scale": "major pentatonic",
+            },
+            {"type": "control", "control": 7, "minval": 0, "maxval": 127},
+            {"type": "control", "control": 9, "minval": 0, "maxval": 127},
+        ],
+    },
+    {
+        "type": "color",
+        "range": {
+            "type": "RGB",
+            "refval": "red",
+            "target": 0,
+            "targetdelta": 0.01,
+            "xref": "green",
+            "xmin": 0.8,
+            "xmax": 1,
+            "ymin": 0.4,
+            "ymax": 0.6,
+        },
+        "channel": 2,
+        "renderers": [
+            {
+                "type": "diatonic",
+                "fundamental": "C2",
+                "range": 5,
+                "scale": "major pentatonic",
+            },
+            {"type": "control", "control": 7, "minval": 0, "maxval": 127},
+            {"type": "control", "control": 9, "minval": 0, "maxval": 127},
+        ],
+    },
+]
+
+
+def build_renderer(spec: dict):
+    """
+    :return a callable rendering a playpoint (0~1) to an Event
+    """
+    kind = spec["type"]
+    if kind == "diatonic":
+        table = diatonic_table(
+            Note(spec["fundamental"]),
+            int(spec["range"]),
+            SCALES[spec["scale"]],
+        )
+        return lambda val: Event(notes=[table[val]])
+    elif kind == "chromatic":
+        table = chromatic_table(Note(spec["min_note"]), Note(spec["max_note"]))
+        return lambda val: Event(notes=[table[val]])
+    elif kind == "control":
+        table = control_table(
+            int(spec["control"]), int(spec["minval"]), int(spec["maxval"])
+        )
+        return lambda val: Event(controls=[table[val]])
+    raise ValueError("unknown renderer type '{}'".format(kind))
+
+
+class HeadlessConsumer:
+    """
+    GUI-less counterpart of ColorConsumer, with its settings fixed at construction
+    """
+
+    def __init__(self, process, renderers, players, plane="rgb"):
+        """
+        :param process: callable turning a ScanlineFrame into a list of playpoint lists
+        :param renderers: callables rendering a playpoint to an Event
+        :param players: EventPlayer instances
+        :param plane: name of the ScanlineFrame plane read by process
+        """
+        self.process = process
+        self.renderers = renderers
+        self.players = players
+        self.plane = plane
+
+    @staticmethod
+    def from_spec(spec: dict, player_factory):
+        """
+        :param spec: consumer description, see the module documentation
+        :param player_factory: callable returning the list of players for a MIDI channel
+        """
+        kind = spec["type"]
+        if kind == "luma":
+            process = partial(
+                luma_playpoints,
+                minluma=float(spec["minluma"]),
+                maxluma=float(spec["maxluma"]),
+            )
+            plane = "luma"
+        elif kind == "color":
+            params = range_params(spec["range"])
+            process = partial(range_playpoints, **params)
+            plane = params["plane"]
+        else:
+            raise ValueError("unknown consumer type '{}'".format(kind))
+        return HeadlessConsumer(
+            process,
+            [build_renderer(r) for r in spec["renderers"]],
+            player_factory(int(spec.get("channel", 1))),
+            plane,
+        )
+
+    def analyze(self, frame: ScanlineFrame) -> Event:
+        event = Event()
+        with recorder.measure("process"):
+            playpoints_list = self.process(frame)
+        with recorder.measure("renderer"):
+            for render_event, playpoints in zip(self.renderers, playpoints_list):
+                for val in playpoints:
+                    event.merge(render_event(val))
+        return event
+
+    def emit(self, event: Event):
+        with recorder.measure("play"):
+            for p in self.players:
+                p.play(event)
+
+    def stop(self):
+        for p in self.players:
+            p.stop()
+
+
+class IMproVisionEngine:
+    """
+    scans a document frame with a set of headless consumers
+    """
+
+    def __init__(self, document, consumers, bpm=120, beats=4, timeres=20):
+        """
+        :param document: lib.document.Document to scan, its frame (or its bounding box,
+                         if the frame is empty) is the scanned area
+        :param consumers: HeadlessConsumer instances
+        :param timeres: minimum step duration, in milliseconds
+        """
+        self.document = document
+        self.consumers = consumers
+        self.bpm = bpm
+        self.beats = beats
+        self.timeres = timeres
+        self.sampler = ScanlineSampler(document.layer_stack)
+        self.time = 0.0
+
+        frame = document.get_frame()
+        if frame[2] <= 0 or frame[3] <= 0:
+            frame = document.get_bbox()
+        self.frame = tuple(int(v) for v in frame)
+
+    def get_step(self) -> (int, float):
+        """
+        :return (stepinc, step duration in seconds), see IMproVision.updateVision
+        """
+        pixel_duration = ((60 / self.bpm) * self.beats) / self.frame[2]
+        stepinc = max(1, math.ceil((self.timeres / 1000) / pixel_duration))
+        return stepinc, pixel_duration * stepinc
+
+    def play_column(self, step):
+        x, y, _, h = self.frame
+        scanline = self.sampler.sample(x + step, y, h)
+        for c in self.consumers:
+            c.emit(c.analyze(scanline))
+
+    def run(self, loops=1):
+        """
+        scan the frame in real time
+        :param loops: number of passes over the frame
+        """
+        w = self.frame[2]
+        stepinc, period = self.get_step()
+        clock = ScanlineClock()
+        sleeper = threading.Event()
+        start = time.monotonic()
+        step = 0
+        while step < w * loops:
+            self.time = time.monotonic() - start
+            self.play_column(step % w)
+            step += stepinc * clock.wait(period, sleeper)
+        self.time = time.monotonic() - start
+        self.stop()
+
+    def analyze_all(self, columns) -> {int: [Event]}:
+        """
+        analyze a set of columns in batch: the frame is rendered with a single call and
+        the color planes are converted once per tile strip instead of once per column
+        :param columns: frame relative column indexes
+        :return column -> list of events (one per consumer)
+        """
+        x, y, w, h = self.frame
+        self.sampler.prefetch(x, y, w, h)
+        planes = {c.plane for c in self.consumers}
+        wanted = set(columns)
+        events = {}
+        for bx in range(0, w, TILE_SIZE):
+            bw = min(TILE_SIZE, w - bx)
+            if wanted.isdisjoint(range(bx, bx + bw)):
+                continue
+            block = self.sampler.sample_block(x + bx, y, bw, h)
+            for name in planes:
+                block.get_plane(name)
+            for i, scanline in enumerate(block.columns()):
+                if bx + i in wanted:
+                    events[bx + i] = [c.analyze(scanline) for c in self.consumers]
+        return events
+
+    def export(self, loops=1):
+        """
+        scan the frame in virtual time, as fast as possible: self.time follows the time
+        the steps would be played at, so timestamping players produce the same output of
+        a real time run
+        :param loops: number of passes over the frame
+        """
+        w = self.frame[2]
+        stepinc, period = self.get_step()
+        steps = range(0, w * loops, stepinc)
+        events = self.analyze_all(s % w for s in steps)
+        for i, step in enumerate(steps):
+            self.time = i * period
+            for c, event in zip(self.consumers, events[step % w]):
+                c.emit(event)
+        self.time = len(steps) * period
+        self.stop()
+
+    def stop(self):
+        for c in self.consumers:
+            c.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m gui.improvision.engine",
+        description="Play an OpenRaster drawing through IMproVision, without the GUI",
+    )
+    parser.add_argument("drawing", help="OpenRaster (.ora) file to scan")
+    parser.add_argument("-o", "--output", help="write a Standard MIDI File")
+    parser.add_argument(
+        "-p", "--port", type=int, help="stream to the MIDI output with this device id"
+    )
+    parser.add_argument(
+        "-b",
+        "--backend",
+        default="pygame",
+        choices=get_backend_names(),
+        help="MIDI backend used by --port",
+    )
+    parser.add_argument("-c", "--consumers", help="JSON file with consumer specs")
+    parser.add_argument("--bpm", type=float, default=120)
+    parser.add_argument("--beats", type=float, default=4)
+    parser.add_argument("--timeres", type=float, default=20, help="milliseconds")
+    parser.add_argument("--loops", type=int, default=1)
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help="scan in real time even when only writing a file",
+    )
+    args = parser.parse_args(argv)
+
+    if args.output is None and args.port is None:
+        parser.error("at least one of --output and --port is needed")
+
+    specs = DEFAULT_CONSUMERS
+    if args.consumers is not None:
+        with open(args.consumers) as f:
+            specs = json.load(f)
+
+    document = Document(painting_only=True)
+    document.load_ora(args.drawing)
+
+    engine = None
+    writer = MidiFileWriter(bpm=args.bpm)
+
+    def players(channel):
+        out = []
+        if args.output is not None:
+            out.append(MidiFilePlayer(writer, lambda: engine.time, channel))
+        if args.port is not None:
+            out.append(PortMidiPlayer(channel, args.port, args.backend))
+        return out
+
+    engine = IMproVisionEngine(
+        document,
+        [HeadlessConsumer.from_spec(s, players) for s in specs],
+        bpm=args.bpm,
+        beats=args.beats,
+        timeres=args.timeres,
+    )
+    try:
+        if args.port is None and not args.realtime:
+            engine.export(args.loops)
+        else:
+            engine.run(args.loops)
+    finally:
+        if args.output is not None:
+            writer.write(args.output)
+        document.cleanup()
+
+
+if __name__ == "__main__":
+    main()
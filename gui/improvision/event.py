@@ -10,12 +10,24 @@
 import math
 import re
 from typing import List
-from .configurable import Configuration, NumericConfiguration
 
-from lib.gibindings import Gtk
+
+def iter_bits(mask: int):
+    """
+    :return the indexes of the bits set in mask, lowest first
+
+    >>> list(iter_bits(0b100101))
+    [0, 2, 5]
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
 
 
 class Note:
+    __slots__ = ("note", "bend", "velocity")
+
     _note_names = [
         ("C"),
         ("C#", "Db"),
@@ -31,6 +43,19 @@ class Note:
         ("B"),
     ]
     _base_octave = -1
+    # full velocity notes, indexed by note * 128 + bend, see Note.get()
+    _interned = [None] * (128 * 128)
+
+    @staticmethod
+    def get(note: int, bend: int = 0) -> "Note":
+        """
+        :return the shared full velocity instance of a note, notes must not be modified
+        """
+        i = note * 128 + bend
+        n = Note._interned[i]
+        if n is None:
+            n = Note._interned[i] = Note((note, bend))
+        return n
 
     def __init__(self, notedef, velocity=127):
         """
@@ -105,7 +130,7 @@ class Note:
         if note > 127:
             note = 127
             bend = 127
-        return Note((note, bend))
+        return Note.get(note, bend)
 
     def __sub__(self, other):
         on = Note(other)
@@ -117,7 +142,7 @@ class Note:
         if note < 0:
             note = 0
             bend = 0
-        return Note((note, bend))
+        return Note.get(note, bend)
 
     def __str__(self):
         note = self._note_names[self.note % len(self._note_names)][0]
@@ -201,6 +226,22 @@ class ControlValue:
     represents a midi control change event
     """
 
+    __slots__ = ("control", "value")
+
+    # indexed by control * 128 + value, see ControlValue.get()
+    _interned = [None] * (128 * 128)
+
+    @staticmethod
+    def get(control: int, value: int) -> "ControlValue":
+        """
+        :return the shared instance of a control change, which must not be modified
+        """
+        i = control * 128 + value
+        c = ControlValue._interned[i]
+        if c is None:
+            c = ControlValue._interned[i] = ControlValue(control, value)
+        return c
+
     def __init__(self, control: int, value: int = 0):
         self.control = int(control)
         self.value = int(value)
@@ -244,6 +285,8 @@ class ProgramChange:
     represents a midi program change event
     """
 
+    __slots__ = ("program",)
+
     def __init__(self, program):
         self.program = int(program)
 
@@ -261,90 +304,106 @@ class ProgramChange:
         return ProgramChange(int(strdef))
 
     def __eq__(self, other):
-        return self.program == other.program
+        return isinstance(other, ProgramChange) and self.program == other.program
 
     def __lt__(self, other):
         return self.program < other.program
 
 
+# control slot value of the controls not set in an event
+NO_CONTROL = 0xFF
+NO_CONTROLS = bytes([NO_CONTROL]) * 128
+
+
 class Event:
     """
     represents an output event (note, control or program change set)
+
+    notes are kept as a bitmask of note numbers, so an event holds at most one note per
+    number (notes with bend or velocity other than the defaults are kept aside to give
+    them back unchanged), controls as an array of 128 values, one per control number,
+    so a control set again by a merge takes the last value
     """
 
+    __slots__ = ("note_mask", "control_mask", "_controls", "_notes", "program")
+
     def __init__(
         self,
-        notes: List[Note] = [],
-        controls: List[ControlValue] = [],
+        notes: List[Note] = (),
+        controls: List[ControlValue] = (),
         program: ProgramChange = None,
     ):
-        self.notes = set(notes)
-        self.controls = set(controls)
+        self.note_mask = 0
+        self.control_mask = 0
+        self._controls = None
+        # note number -> note, for the notes that are not the interned Note.get(number)
+        self._notes = None
         self.program = program
+        for n in notes:
+            self.add_note(n)
+        for c in controls:
+            self.add_control(c)
+
+    def add_note(self, note: Note):
+        self.note_mask |= 1 << note.note
+        if note.bend != 0 or note.velocity != 127:
+            if self._notes is None:
+                self._notes = {}
+            self._notes[note.note] = note
+        elif self._notes is not None:
+            self._notes.pop(note.note, None)
+
+    def add_control(self, control: ControlValue):
+        if self._controls is None:
+            self._controls = bytearray(NO_CONTROLS)
+        self._controls[control.control] = control.value
+        self.control_mask |= 1 << control.control
+
+    def get_note(self, number: int) -> Note:
+        if self._notes is not None:
+            note = self._notes.get(number)
+            if note is not None:
+                return note
+        return Note.get(number)
+
+    def get_control(self, control: int) -> int:
+        """
+        :return the value of control, None if not set
+        """
+        if self.control_mask >> control & 1:
+            return self._controls[control]
+        return None
 
-    def merge(self, other):
-        self.notes |= other.notes
-        self.controls |= other.controls
-        if self.program is None:
-            self.program = other.program
-
-
-class NoteConfiguration(Configuration):
-    def __init__(
-        self,
-        name: str,
-        pref_path: str,
-        dfl_val: Note,
-        lower: Note = Note(0),
-        upper: Note = Note((127, 127)),
-        gui_setup_cb=None,
-    ):
-        super().__init__(name, pref_path, str(dfl_val), gui_setup_cb)
-        self._lower = lower
-        self._upper = upper
-        self._buf = None
-
-    def specific_setup(self, pref_path, value):
-        self._buf = Gtk.EntryBuffer()
-        self._buf.set_text(value, len(value))
-
-        def _text_deleted(b, p, n):
-            self._set_value(str(self.get_value()))
-
-        def _text_inserted(b, p, c, n):
-            self._set_value(str(self.get_value()))
-
-        self._buf.connect("deleted-text", _text_deleted)
-        self._buf.connect("inserted-text", _text_inserted)
-
-    def _get_gui_item(self):
-        entry = Gtk.Entry()
-        entry.set_buffer(self._buf)
-
-        def _plus_cb(b):
-            nn = str(self.get_value() + 1)
-            self._buf.set_text(nn, len(nn))
-
-        plus = Gtk.Button.new_with_label("+")
-        plus.connect("clicked", _plus_cb)
-
-        def _minus_cb(b):
-            nn = str(self.get_value() - 1)
-            self._buf.set_text(nn, len(nn))
-
-        minus = Gtk.Button.new_with_label("-")
-        minus.connect("clicked", _minus_cb)
+    def iter_controls(self):
+        """
+        :return (control, value) pairs of the controls set in the event
+        """
+        for c in iter_bits(self.control_mask):
+            yield c, self._controls[c]
 
-        grid = Gtk.Grid()
-        grid.attach(entry, 0, 0, 1, 1)
-        grid.attach(minus, 1, 0, 1, 1)
-        grid.attach(plus, 2, 0, 1, 1)
+    @property
+    def notes(self) -> {Note}:
+        return {self.get_note(n) for n in iter_bits(self.note_mask)}
 
-        return grid
+    @property
+    def controls(self) -> {ControlValue}:
+        return {
+            ControlValue.get(c, self._controls[c]) for c in iter_bits(self.control_mask)
+        }
 
-    def get_value(self):
-        try:
-            n = Note(self._buf.get_text())
-        except:
-            n = Note(self._get_preference_value())
-        return n
+    def merge(self, other):
+        self.note_mask |= other.note_mask
+        if other._notes is not None:
+            if self._notes is None:
+                self._notes = dict(other._notes)
+            else:
+                self._notes.update(other._notes)
+        if other.control_mask:
+            if self._controls is None:
+                self._controls = bytearray(other._controls)
+            else:
+                for c in iter_bits(other.control_mask):
+                    self._controls[c] = other._controls[c]
+            self.control_mask |= other.control_mask
+        if self.program is None:
+            self.program = other.program
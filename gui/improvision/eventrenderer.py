@@ -7,16 +7,105 @@
 # (at your option) any later version.
 
 
-from .event import Note, NoteConfiguration, Event, ProgramChange, ControlValue
-from .configurable import Configurable, NumericConfiguration, ListConfiguration
+from .event import Note, Event
+from .configurable import (
+    Configurable,
+    Configuration,
+    NumericConfiguration,
+    ListConfiguration,
+)
 from lib.gibindings import Gtk
-from .utils import map_to_range
+from .tables import LookupTable, SCALES, chromatic_table, diatonic_table, control_table
+
+
+class NoteConfiguration(Configuration):
+    def __init__(
+        self,
+        name: str,
+        pref_path: str,
+        dfl_val: Note,
+        lower: Note = Note(0),
+        upper: Note = Note((127, 127)),
+        gui_setup_cb=None,
+    ):
+        super().__init__(name, pref_path, str(dfl_val), gui_setup_cb)
+        self._lower = lower
+        self._upper = upper
+        self._buf = None
+
+    def specific_setup(self, pref_path, value):
+        self._buf = Gtk.EntryBuffer()
+        self._buf.set_text(value, len(value))
+
+        def _text_deleted(b, p, n):
+            self._set_value(str(self.get_value()))
+
+        def _text_inserted(b, p, c, n):
+            self._set_value(str(self.get_value()))
+
+        self._buf.connect("deleted-text", _text_deleted)
+        self._buf.connect("inserted-text", _text_inserted)
+
+    def _get_gui_item(self):
+        entry = Gtk.Entry()
+        entry.set_buffer(self._buf)
+
+        def _plus_cb(b):
+            nn = str(self.get_value() + 1)
+            self._buf.set_text(nn, len(nn))
+
+        plus = Gtk.Button.new_with_label("+")
+        plus.connect("clicked", _plus_cb)
+
+        def _minus_cb(b):
+            nn = str(self.get_value() - 1)
+            self._buf.set_text(nn, len(nn))
+
+        minus = Gtk.Button.new_with_label("-")
+        minus.connect("clicked", _minus_cb)
+
+        grid = Gtk.Grid()
+        grid.attach(entry, 0, 0, 1, 1)
+        grid.attach(minus, 1, 0, 1, 1)
+        grid.attach(plus, 2, 0, 1, 1)
+
+        return grid
+
+    def get_value(self):
+        try:
+            n = Note(self._buf.get_text())
+        except:
+            n = Note(self._get_preference_value())
+        return n
 
 
 class EventRenderer(Configurable):
+    """
+    renderers mapping playpoints through a LookupTable implement build_table(), the
+    table is built on first use and rebuilt once a new configuration snapshot is
+    published (see Configurable.settings_version)
+    """
+
+    # (settings_version, table) of the last built table
+    _table = None
+
     def __init__(self):
         super().__init__(expanded=True)
 
+    def build_table(self) -> LookupTable:
+        raise NotImplementedError
+
+    def get_table(self) -> LookupTable:
+        version = self.settings_version
+        cached = self._table
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # values published while building are caught by the next call, as the table
+        # is tagged with the version read before
+        table = self.build_table()
+        self._table = (version, table)
+        return table
+
     def render(self, vals: ([float])) -> Event:
         event = Event()
         for val in vals:
@@ -43,10 +132,15 @@ class ChromaticRenderer(EventRenderer):
             },
         )
 
+    def build_table(self) -> LookupTable:
+        return chromatic_table(self.min_note, self.max_note)
+
+    def render(self, vals: ([float])) -> Event:
+        table = self.get_table()
+        return Event(notes=[table[val] for val in vals])
+
     def render_event(self, val: float) -> Event:
-        return Event(
-            notes=[self.min_note + int(val * (self.max_note - self.min_note).note)]
-        )
+        return Event(notes=[self.get_table()[val]])
 
 
 class ScaleConfiguration(ListConfiguration):
@@ -62,29 +156,7 @@ class ScaleConfiguration(ListConfiguration):
 
 
 class DiatonicRenderer(EventRenderer):
-    scales = {
-        "minor pentatonic": [Note(0), Note(3), Note(5), Note(7), Note(10)],
-        "major pentatonic": [Note(0), Note(2), Note(4), Note(7), Note(9)],
-        "major": [Note(0), Note(2), Note(4), Note(5), Note(7), Note(9), Note(11)],
-        "minor natural": [
-            Note(0),
-            Note(2),
-            Note(3),
-            Note(5),
-            Note(7),
-            Note(8),
-            Note(10),
-        ],
-        "minor harmonic": [
-            Note(0),
-            Note(2),
-            Note(3),
-            Note(5),
-            Note(7),
-            Note(8),
-            Note(11),
-        ],
-    }
+    scales = SCALES
 
     def __init__(self, fundamental: Note, octaves_range: int, scale: str):
         super().__init__()
@@ -103,12 +175,15 @@ class DiatonicRenderer(EventRenderer):
             },
         )
 
+    def build_table(self) -> LookupTable:
+        return diatonic_table(self.fundamental, self.range, self.scale)
+
+    def render(self, vals: ([float])) -> Event:
+        table = self.get_table()
+        return Event(notes=[table[val] for val in vals])
+
     def render_event(self, val: float) -> Event:
-        scale = self.scale
-        trasl = int(round(val * ((self.range * len(scale)) - 1), 0))
-        scalenote = scale[trasl % len(scale)]
-        octave = int(trasl / len(scale))
-        return Event(notes=[self.fundamental + scalenote.note + (octave * 12)])
+        return Event(notes=[self.get_table()[val]])
 
 
 class ControlChangeRenderer(EventRenderer):
@@ -131,10 +206,12 @@ class ControlChangeRenderer(EventRenderer):
             },
         )
 
+    def build_table(self) -> LookupTable:
+        return control_table(self.control, self.minval, self.maxval)
+
+    def render(self, vals: ([float])) -> Event:
+        table = self.get_table()
+        return Event(controls=[table[val] for val in vals])
+
     def render_event(self, val: float) -> Event:
-        e = Event(
-            controls=[
-                ControlValue(self.control, map_to_range(self.minval, self.maxval, val))
-            ]
-        )
-        return e
+        return Event(controls=[self.get_table()[val]])
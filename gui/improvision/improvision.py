@@ -9,20 +9,28 @@
 
 import threading
 import math
+import time
 
-import lib.color
-
-from lib.pycompat import xrange
-from lib.pycompat import PY3
-
-from lib.gibindings import Gtk
+from lib.gibindings import Gtk, GLib
 
 import gui.overlays
 import gui.drawutils
 from gui.framewindow import FrameOverlay
+from lib.tiledsurface import TILE_SIZE
 from . import colorconsumer, eventrenderer, player, colorrange
+from .sampler import ScanlineSampler
+from .scanline import reduce_band, band_spans
+from .scheduler import ScanlineClock
+from .pipeline import LookaheadBuffer, FrameRing
+from .latency import recorder
+from .procpool import KernelPool
 from .event import Note
-from .configurable import Configurable, NumericConfiguration
+from .configurable import (
+    Configurable,
+    NumericConfiguration,
+    BoolConfiguration,
+    ListConfiguration,
+)
 
 
 class IMproVision(gui.overlays.Overlay, Configurable):
@@ -44,6 +52,18 @@ class IMproVision(gui.overlays.Overlay, Configurable):
     SCANLINE_DEFAULT_TIME_RES_MS = 20
     SCANLINE_MAX_TIME_RES_MS = 1000
 
+    # number of steps rendered and analyzed ahead of the scanline, 0 disables lookahead
+    SCANLINE_PREF_LOOKAHEAD = "improvision-lookahead"
+    SCANLINE_MIN_LOOKAHEAD = 0
+    SCANLINE_DEFAULT_LOOKAHEAD = 0
+    SCANLINE_MAX_LOOKAHEAD = 64
+    # longest wait for the lookahead worker to analyze the first step, in seconds
+    LOOKAHEAD_PRIME_TIMEOUT = 0.5
+
+    # automatic sampling resolution: scanline pixels for each value of the finest height
+    # renderer, so that runs still fall on the right value after downscaling
+    SAMPLING_ROWS_PER_VALUE = 4
+
     # scanline default angle in radians, where 0 is left to right and
     # rotation goes on counter clockwise
     SCANLINE_DEFAULT_ANGLE = 0
@@ -63,15 +83,24 @@ class IMproVision(gui.overlays.Overlay, Configurable):
         self.active = False
         self.step = -1
         self.stepinc = 1
-        self.step_changed = False
         self.continuous = False
         self.single_step = False
 
         self.update_thread = threading.Thread(target=self.updateVision, daemon=True)
         self.play_thread = threading.Thread(target=self.processSound, daemon=True)
+        self.lookahead_thread = threading.Thread(
+            target=self.lookaheadSound, daemon=True
+        )
         self.threads_started = False
         self.sleeper = threading.Event()
         self.data_ready = threading.Event()
+        self.sampler = ScanlineSampler(self.app.doc.model.layer_stack)
+        self.sampler.content_changed += self._content_changed_cb
+        self.clock = ScanlineClock()
+        self.lookahead_buffer = LookaheadBuffer()
+        # the lookahead worker and processSound (on buffer misses) both refresh the
+        # timelines, one pass at a time
+        self._refresh_lock = threading.Lock()
 
         # XXX: setup note consumers here
         self.consumers = [
@@ -126,12 +155,81 @@ class IMproVision(gui.overlays.Overlay, Configurable):
                     self.SCANLINE_MIN_TIME_RES_MS,
                     self.SCANLINE_MAX_TIME_RES_MS,
                 ),
+                "replay": BoolConfiguration("Analyze once", "replay", False),
+                "lookahead": NumericConfiguration(
+                    "Lookahead (steps)",
+                    "lookahead",
+                    Gtk.SpinButton,
+                    self.SCANLINE_DEFAULT_LOOKAHEAD,
+                    self.SCANLINE_MIN_LOOKAHEAD,
+                    self.SCANLINE_MAX_LOOKAHEAD,
+                ),
+                "band": ListConfiguration(
+                    "Skipped columns",
+                    "band",
+                    "Ignore",
+                    {
+                        "Ignore": None,
+                        "Keep strongest": "max",
+                        "Average": "mean",
+                        "Any match": "any",
+                    },
+                ),
+                "sampling": ListConfiguration(
+                    "Sampling resolution",
+                    "sampling",
+                    "Full",
+                    {
+                        "Full": 0,
+                        "1/2": 1,
+                        "1/4": 2,
+                        "1/8": 3,
+                        "1/16": 4,
+                        "Auto": None,
+                    },
+                ),
+                "processes": BoolConfiguration(
+                    "Worker processes", "processes", False
+                ),
             },
             self.consumers,
             expanded=True,
         )
 
         self.active_row = None
+        # model column of the step before active_row, None at the first step
+        self.active_previous = None
+        self.kernel_pool = None
+
+        # scanlines are broadcast to the consumers, run by a shared pool of threads
+        self.frame_ring = FrameRing()
+        for c in self.consumers:
+            c.reader = self.frame_ring.attach(c)
+
+    def add_to_grid(self, grid, row):
+        row = super().add_to_grid(grid, row)
+        # preferences are only loaded now
+        self._update_kernel_pool()
+        return row
+
+    def configuration_changed(self):
+        self._update_kernel_pool()
+
+    def _update_kernel_pool(self):
+        """
+        start or stop the worker processes running the consumers analysis
+        """
+        if self.processes and self.kernel_pool is None:
+            self.kernel_pool = KernelPool()
+        elif not self.processes and self.kernel_pool is not None:
+            pool = self.kernel_pool
+            self.kernel_pool = None
+            for c in self.consumers:
+                c.kernel_pool = None
+            # pending kernels complete before the workers are stopped
+            threading.Thread(target=pool.close, daemon=True).start()
+        for c in self.consumers:
+            c.kernel_pool = self.kernel_pool
 
     def init_frame(self):
         if self.frame is None:
@@ -163,10 +261,12 @@ class IMproVision(gui.overlays.Overlay, Configurable):
         if not self.threads_started:
             self.update_thread.start()
             self.play_thread.start()
-            for c in self.consumers:
-                c.start()
+            self.lookahead_thread.start()
+            self.frame_ring.start()
             self.threads_started = True
         self.active = True
+        # wake the lookahead worker, the first step waits for it (see _prime_lookahead)
+        self.lookahead_buffer.resize(int(self.lookahead))
         self.sleeper.set()
         if not self.frame.doc.model.frame_enabled:
             self.app.find_action("FrameEditMode").activate()
@@ -177,24 +277,18 @@ class IMproVision(gui.overlays.Overlay, Configurable):
         self.step = -1
         self.redraw()
         self.sleeper.set()
+        self.lookahead_buffer.clear()
         for c in self.consumers:
             c.stop()
 
     def redraw(self):
-        self.app.doc.tdw.queue_draw()
+        # called from the scheduler thread too, let the main loop do the actual work
+        GLib.idle_add(self.app.doc.tdw.queue_draw)
 
     def paint(self, cr):
-        if self.active or self.single_step:
-
-            if self.step_changed:
-                self.step_changed = False
-
-                self.active_row = self.app.doc.model.frame[:]
-                self.active_row[0] += self.step
-                self.active_row[2] = 1
-
-                self.data_ready.set()
-
+        # the scanline position is only read here, stepping and analysis are driven
+        # by the scheduler thread, independently of redraws
+        if (self.active or self.single_step) and self.active_row is not None:
             base = self.app.doc.tdw.model_to_display(
                 self.active_row[0], self.active_row[1]
             )
@@ -215,6 +309,8 @@ class IMproVision(gui.overlays.Overlay, Configurable):
             gui.drawutils.render_drop_shadow(cr, z=1, line_width=2)
 
     def updateVision(self):
+        ticks = 1
+        prime = True
         while True:
             self.sleeper.clear()
             if self.active:
@@ -222,73 +318,292 @@ class IMproVision(gui.overlays.Overlay, Configurable):
                 if w == 0:
                     self.sleeper.wait(timeout=0.01)
                     continue
-                interrupt = False
-                if self.single_step:
-                    interrupt = True
-                    self.step = (self.step + 1) % w
-                elif self.continuous:
-                    self.step = (self.step + self.stepinc) % w
-                else:
-                    if self.step + self.stepinc > w:
-                        interrupt = True
-                        self.stop(None)
-                        self.step = w - 1
-                    else:
-                        self.step += self.stepinc
-                self.step_changed = True
-                self.redraw()
-                if interrupt:
-                    self.active = False
-                    continue
-                else:
-                    timeres = self.timeres / 1000
-                    pixel_duration = ((60 / self.bpm) * self.beats) / w
-                    if pixel_duration < timeres:
-                        self.stepinc = math.ceil(timeres / pixel_duration)
-                        pixel_duration *= self.stepinc
-                    self.sleeper.wait(timeout=pixel_duration)
+                try:
+                    if prime:
+                        # the first step after a (re)start finds the buffer empty
+                        self._prime_lookahead()
+                        prime = False
+                    if ticks > 0:
+                        step_start = time.monotonic_ns()
+                        interrupt = False
+                        previous = self.step
+                        if self.single_step:
+                            interrupt = True
+                            self.step = (self.step + 1) % w
+                        elif self.continuous:
+                            self.step = (self.step + self.stepinc * ticks) % w
+                        else:
+                            if self.step + self.stepinc * ticks > w:
+                                interrupt = True
+                                self.stop(None)
+                                self.step = w - 1
+                            else:
+                                self.step += self.stepinc * ticks
+                        active_row = list(self.app.doc.model.get_frame())
+                        self.active_previous = (
+                            active_row[0] + previous if previous >= 0 else None
+                        )
+                        active_row[0] += self.step
+                        active_row[2] = 1
+                        self.active_row = active_row
+                        self.redraw()
+                        if self.active:
+                            if self.lookahead_buffer.size > 0:
+                                self._play_step()
+                            else:
+                                self.data_ready.set()
+                        recorder.record("step", step_start, time.monotonic_ns())
+                        if interrupt:
+                            self.active = False
+                            continue
+                    level = self.get_sampling_level()
+                    if level != self.sampler.mipmap_level:
+                        self.sampler.set_mipmap_level(level)
+                except Exception as e:
+                    print("error playing step: {}".format(e))
+                timeres = self.timeres / 1000
+                pixel_duration = ((60 / self.bpm) * self.beats) / w
+                self.stepinc = max(1, math.ceil(timeres / pixel_duration))
+                pixel_duration *= self.stepinc
+                # late ticks are coalesced, the skipped steps are jumped over
+                ticks = self.clock.wait(pixel_duration, self.sleeper)
             else:
+                self.clock.reset()
+                ticks = 1
+                prime = True
                 self.sleeper.wait()
 
-    def processSound(self):
+    def _content_changed_cb(self, sampler, x, w):
+        for c in self.consumers:
+            c.timeline.invalidate(x, w)
+        self.lookahead_buffer.invalidate(x, w)
+
+    def analyze_pass(self, frame):
+        """
+        fill the timelines of all the enabled consumers, analyzing only the columns
+        that are not cached yet, with band sampling each column is merged with the
+        columns skipped before it (see sample_step())
+        :param frame: the document frame (x, y, w, h)
+        """
+        fx, fy, fw, fh = frame
+        consumers = [c for c in self.consumers if c.enabled]
+        generations = [c.timeline.generation for c in consumers]
+        missing = [set(c.timeline.missing(range(fx, fx + fw))) for c in consumers]
+        wanted = set().union(*missing)
+        # render the frame with a single call and convert the planes once per tile
+        # strip, like IMproVisionEngine.analyze_all()
+        planes = {c.plane for c in consumers}
+        if len(wanted) > 0:
+            self.sampler.prefetch(fx, fy, fw, fh)
+        if self.band is not None and self.stepinc > 1:
+            # each step merges the columns skipped since the previous one
+            for x in sorted(wanted):
+                previous = self._expected_previous(x, frame)
+                scanline = self.sample_step(x, fy, fh, previous)
+                for c, generation, columns in zip(consumers, generations, missing):
+                    if x in columns:
+                        c.timeline.store(x, c.analyze(scanline), generation)
+        else:
+            for bx in range(fx, fx + fw, TILE_SIZE):
+                bw = min(TILE_SIZE, fx + fw - bx)
+                if wanted.isdisjoint(range(bx, bx + bw)):
+                    continue
+                scanlines = self.sampler.sample_columns(bx, fy, bw, fh, planes)
+                for x, scanline in enumerate(scanlines, bx):
+                    for c, generation, columns in zip(consumers, generations, missing):
+                        if x in columns:
+                            c.timeline.store(x, c.analyze(scanline), generation)
+        for c, generation in zip(consumers, generations):
+            c.timeline.mark_clean(generation)
+
+    def _refresh_timelines(self, frame):
+        # with band sampling the events of a column depend on the step size too
+        band = None
+        if self.band is not None and self.stepinc > 1:
+            band = (self.band, self.stepinc, self.continuous)
+        with self._refresh_lock:
+            for c in self.consumers:
+                c.timeline.validate((c.get_analysis_key(), frame, band))
+            if any(c.timeline.dirty for c in self.consumers if c.enabled):
+                self.analyze_pass(frame)
+
+    def get_sampling_level(self):
+        """
+        :return the mipmap level the scanlines should be rendered at, in auto mode the
+                coarsest one still giving SAMPLING_ROWS_PER_VALUE pixels to each value
+                of the enabled height renderers
+        """
+        level = self.sampling
+        if level is not None:
+            return level
+        values = max(
+            (len(c.renderers[0].get_table()) for c in self.consumers if c.enabled),
+            default=0,
+        )
+        if values == 0:
+            return 0
+        h = self.app.doc.model.get_frame()[3]
+        level = 0
+        while (h >> (level + 1)) >= values * self.SAMPLING_ROWS_PER_VALUE:
+            level += 1
+        return level
+
+    def sample_step(self, x, y, h, previous=None):
+        """
+        get the scanline of a step, when the scanline moved by more than one column
+        and band sampling is on, the columns skipped since the previous step (wrapping
+        at the end of the frame) are rendered together with x and merged into a single
+        column (see reduce_band)
+        :param previous: model column of the previous step, None if there is none
+        :return the ScanlineFrame to be analyzed for column x
+        """
+        band = self.band
+        if band is None or previous is None:
+            return self.sampler.sample(x, y, h)
+        fx, _, fw, _ = self.app.doc.model.get_frame()
+        spans = band_spans(previous - fx, x - fx, fw)
+        if len(spans) == 1 and spans[0][1] == 1:
+            return self.sampler.sample(x, y, h)
+        frame = self.sampler.sample_spans([(fx + s, n) for s, n in spans], y, h)
+        return reduce_band(frame, band)
+
+    def _expected_previous(self, x, frame):
+        """
+        :return model column of the step before x when the scanline moves by stepinc
+                columns (see updateVision()), None if x is the first step
+        """
+        fx, _, fw, _ = frame
+        previous = x - self.stepinc
+        if previous < fx:
+            if not self.continuous:
+                return None
+            previous += fw
+        return previous
+
+    def analyze_column(self, x, y, h, previous=None):
+        """
+        :param previous: model column of the previous step, see sample_step()
+        :return the events generated by each consumer for column x (None for the
+                disabled ones), cached timeline events are used in replay mode
+        """
+        scanline = None
+        events = []
+        for c in self.consumers:
+            event = None
+            if c.enabled:
+                if self.replay:
+                    event = c.timeline.get(x)
+                if event is None:
+                    if scanline is None:
+                        scanline = self.sample_step(x, y, h, previous)
+                    event = c.analyze(scanline)
+            events.append(event)
+        return events
+
+    def _upcoming_columns(self, frame, count):
+        fx, _, w, _ = frame
+        columns = []
+        step = self.step
+        # single steps move by one column, see updateVision()
+        stepinc = 1 if self.single_step else self.stepinc
+        for _ in range(count):
+            step += stepinc
+            if self.continuous or self.single_step:
+                step %= w
+            elif step >= w:
+                break
+            columns.append(fx + step)
+        return columns
+
+    def _prime_lookahead(self):
+        """
+        wait (up to LOOKAHEAD_PRIME_TIMEOUT) for the lookahead worker to analyze the
+        column of the next step
+        """
+        if int(self.lookahead) == 0:
+            return
+        columns = self._upcoming_columns(tuple(self.app.doc.model.get_frame()), 1)
+        if len(columns) == 0:
+            return
+        deadline = time.monotonic() + self.LOOKAHEAD_PRIME_TIMEOUT
+        while columns[0] not in self.lookahead_buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.lookahead_buffer.wait(timeout=remaining)
+
+    def _play_step(self):
+        events = self.lookahead_buffer.take(self.active_row[0])
+        if events is None:
+            # the lookahead worker fell behind (or the column was invalidated), the
+            # step is analyzed off the scheduler thread, like without lookahead
+            self.data_ready.set()
+            return
+        for c, event in zip(self.consumers, events):
+            if event is not None:
+                c.emit(event)
+
+    def lookaheadSound(self):
         while True:
             try:
-                self.data_ready.wait()
-                self.data_ready.clear()
+                self.lookahead_buffer.resize(int(self.lookahead))
+                if not self.active or self.lookahead_buffer.size == 0:
+                    self.lookahead_buffer.wait(timeout=0.1)
+                    continue
+
+                frame = tuple(self.app.doc.model.get_frame())
+                if self.replay:
+                    self._refresh_timelines(frame)
 
-                # horrible hack, the render_layer_as_pixbuf reads one pixel ahead, so we bring
-                # the rendering window back before getting color data
-                actual_row = self.active_row[:]
-                actual_row[0] -= 1
+                columns = self._upcoming_columns(frame, self.lookahead_buffer.size)
+                self.lookahead_buffer.retain(columns)
+                todo = [x for x in columns if x not in self.lookahead_buffer]
+                if len(todo) == 0:
+                    self.lookahead_buffer.wait(timeout=0.1)
+                    continue
 
-                pixbuf = self.app.doc.model._layers.render_layer_as_pixbuf(
-                    self.app.doc.model._layers, actual_row
+                # the columns are expected to be reached one step after the other
+                previous = dict(zip(columns, [frame[0] + self.step] + columns[:-1]))
+                generation = self.lookahead_buffer.generation
+                events = self.analyze_column(
+                    todo[0], frame[1], frame[3], previous[todo[0]]
                 )
+                self.lookahead_buffer.put(todo[0], events, generation)
 
-                n_channels = pixbuf.get_n_channels()
-                assert n_channels in (3, 4)
-                data = pixbuf.get_pixels()
-
-                colors = []
-                rowstride = pixbuf.get_rowstride()
-                for y in xrange(min(self.active_row[3], pixbuf.get_height())):
-                    if PY3:
-                        col = lib.color.RGBColor(
-                            data[y * rowstride + n_channels] / 255,
-                            data[y * rowstride + n_channels + 1] / 255,
-                            data[y * rowstride + n_channels + 2] / 255,
-                        )
-                    else:
-                        col = lib.color.RGBColor(
-                            ord(data[y * rowstride + n_channels]) / 255,
-                            ord(data[y * rowstride + n_channels + 1]) / 255,
-                            ord(data[y * rowstride + n_channels + 2]) / 255,
-                        )
-                    colors.append(col)
+            except Exception as e:
+                print("error analyzing lookahead data: {}".format(e))
+                self.lookahead_buffer.wait(timeout=0.1)
 
-                # print("step {}, colors: {}".format(self.step, colors))
-                for c in self.consumers:
-                    c.data_ready(colors)
+    def processSound(self):
+        while True:
+            try:
+                self.data_ready.wait()
+                self.data_ready.clear()
+
+                x, y, _, h = self.active_row
+
+                if self.replay:
+                    frame = tuple(self.app.doc.model.get_frame())
+                    self._refresh_timelines(frame)
+
+                    previous = self.active_previous
+                    if (
+                        self.band is not None
+                        and previous != self._expected_previous(x, frame)
+                    ):
+                        # coalesced ticks (or a single step), the band of this step
+                        # is not the one of the timeline
+                        scanline = self.sample_step(x, y, h, previous)
+                        self.frame_ring.publish((scanline, None))
+                        continue
+
+                    scanline = None
+                    if any(x not in c.timeline for c in self.consumers if c.enabled):
+                        scanline = self.sample_step(x, y, h, previous)
+                    self.frame_ring.publish((scanline, x))
+                else:
+                    scanline = self.sample_step(x, y, h, self.active_previous)
+                    self.frame_ring.publish((scanline, None))
 
             except Exception as e:
                 print("error getting color data: {}".format(e))
@@ -7,13 +7,16 @@
 # (at your option) any later version.
 
 
-from lib.gibindings import Gtk
+from lib.gibindings import Gtk, GLib
 
 from gui.toolstack import SizedVBoxToolWidget, TOOL_WIDGET_NATURAL_HEIGHT_SHORT
 from lib.gettext import gettext as _
 from gui.widgets import inline_toolbar
 from .improvision import IMproVision
 from .configurable import Configurable
+from .latency import recorder
+from .output import get_outputs
+import gui.dialogs
 
 class IMproVisionTool (SizedVBoxToolWidget, Configurable):
     """Dockable panel showing options for IMproVision
@@ -61,6 +64,7 @@ class IMproVisionTool (SizedVBoxToolWidget, Configurable):
         options.show_all()
 
         self.pack_start(options, True, True, 0)
+        self.pack_start(self._get_latency_panel(), False, True, 0)
 
         actions = {
             "IMproVisionTrigger": self._overlay.trigger_one,
@@ -73,6 +77,74 @@ class IMproVisionTool (SizedVBoxToolWidget, Configurable):
             action = self.app.doc.action_group.get_action(a)
             action.connect("activate", cb)
 
+    def _get_latency_panel(self):
+        expander = Gtk.Expander(label=_("Latency (ms)"))
+        box = Gtk.VBox()
+        self._latency_label = Gtk.Label()
+        self._latency_label.set_alignment(0.0, 0.5)
+        box.pack_start(self._latency_label, False, True, 0)
+        dump = Gtk.Button(label=_("Save CSV..."))
+        dump.connect("clicked", self._dump_latency_cb)
+        box.pack_start(dump, False, False, 0)
+        expander.add(box)
+        expander.show_all()
+
+        def _update_cb():
+            if expander.get_expanded():
+                self._update_latency_label()
+            return True
+
+        GLib.timeout_add_seconds(1, _update_cb)
+        return expander
+
+    def _update_latency_label(self):
+        lines = ["{:<10}{:>8}{:>8}{:>8}{:>8}".format("", "p50", "p95", "p99", "max")]
+        for stage, stats in recorder.summary().items():
+            lines.append(
+                "{:<10}{p50:>8.2f}{p95:>8.2f}{p99:>8.2f}{max:>8.2f}".format(
+                    stage, **stats
+                )
+            )
+        clock = self._overlay.clock.stats()
+        lines.append(
+            "clock: drift {drift_mean:.2f} (max {drift_max:.2f}), "
+            "jitter {jitter:.2f}, {skipped} ticks skipped".format(**clock)
+        )
+        suppressed = sum(
+            p.suppressed for c in self._overlay.consumers for p in c.players
+        )
+        lines.append("duplicate messages suppressed: {}".format(suppressed))
+        lookahead = self._overlay.lookahead_buffer
+        lines.append(
+            "lookahead: {} hits, {} misses".format(lookahead.hits, lookahead.misses)
+        )
+        for (backend, device_id), output in sorted(get_outputs().items()):
+            lines.append(
+                "output {} {}: queue {depth} (max {max_depth}), "
+                "send {latency_mean:.2f} (max {latency_max:.2f}), "
+                "{dropped} dropped".format(backend, device_id, **output.stats())
+            )
+        for i, c in enumerate(self._overlay.consumers):
+            if c.reader is None:
+                continue
+            stats = c.reader.stats()
+            lines.append(
+                "consumer {}: {dropped} dropped, {coalesced} skipped".format(i, **stats)
+            )
+        self._latency_label.set_markup(
+            "<tt>{}</tt>".format(GLib.markup_escape_text("\n".join(lines)))
+        )
+
+    def _dump_latency_cb(self, button):
+        _format, filename = gui.dialogs.save_dialog(
+            _("Save latency samples"),
+            self.app.drawWindow,
+            [(_("CSV files"), "*.csv")],
+            default_format=(0, ".csv"),
+        )
+        if filename is not None:
+            recorder.dump_csv(filename)
+
     @property
     def bpm(self):
         return int(self._bpm_adj.get_value())
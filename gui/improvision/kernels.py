@@ -0,0 +1,118 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Playpoint extraction kernels
+
+pure functions of a ScanlineFrame and plain parameters, this module must not depend on
+GTK, so that the kernels can run in worker processes (see procpool)
+"""
+
+import numpy as np
+
+from .scanline import ScanlineFrame, find_runs, run_means, run_heights
+from .utils import map_to_percent
+
+
+def luma_playpoints(frame: ScanlineFrame, minluma: float, maxluma: float) -> [[float]]:
+    """
+    luma detector logic, one playpoint for each run of pixels with luma in range
+    :param frame: a scanline, or a block of columns where a row is in range if any of
+                  its pixels is (see scanline.reduce_band)
+    :return [height playpoints]
+    """
+    if minluma > maxluma:
+        minluma, maxluma = maxluma, minluma
+    luma = frame.luma
+    mask = (luma >= minluma) & (luma <= maxluma)
+    if mask.ndim == 2:
+        mask = mask.any(axis=1)
+    starts, ends = find_runs(mask)
+
+    return [run_heights(starts, ends, len(frame)).tolist()]
+
+
+# color range type -> (frame plane, names of the plane components)
+RANGE_SPACES = {
+    "HSV": ("hsv", ("hue", "saturation", "value")),
+    "RGB": ("rgb", ("red", "green", "blue")),
+}
+
+
+def range_params(colorrange: dict) -> {str: object}:
+    """
+    convert a color range description to range_playpoints() parameters
+    :param colorrange: a ThreeValueColorRange, or a plain dict with the same keys (type,
+                       refval, target, targetdelta, xref, xmin, xmax, ymin, ymax)
+    """
+    plane, components = RANGE_SPACES[colorrange["type"]]
+    refid = components.index(colorrange["refval"])
+    xid = components.index(colorrange["xref"])
+    return {
+        "plane": plane,
+        "refid": refid,
+        "target": colorrange["target"],
+        "targetdelta": colorrange["targetdelta"],
+        "xid": xid,
+        "xmin": colorrange["xmin"],
+        "xmax": colorrange["xmax"],
+        "yid": 3 - refid - xid,
+        "ymin": colorrange["ymin"],
+        "ymax": colorrange["ymax"],
+    }
+
+
+def in_range_values(
+    colors, refid, target, targetdelta, xid, xmin, xmax, yid, ymin, ymax
+) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    batch version of ThreeValueColorRange.in_range_values()
+    :param colors: (N, 3) array of colors in the range color space
+    :return (in_range, x_percent, y_percent) as (N,) arrays
+    """
+    x = colors[:, xid]
+    y = colors[:, yid]
+    mask = (
+        (np.abs(colors[:, refid] - target) < targetdelta)
+        & (xmin <= x)
+        & (x <= xmax)
+        & (ymin <= y)
+        & (y <= ymax)
+    )
+    return (
+        mask,
+        np.where(mask, map_to_percent(xmin, xmax, x), 0),
+        np.where(mask, map_to_percent(ymin, ymax, y), 0),
+    )
+
+
+def range_playpoints(frame: ScanlineFrame, plane: str, **params) -> [[float]]:
+    """
+    color detector logic, one playpoint for each run of pixels with color in range
+    :param frame: a scanline, or a block of columns where a row is in range if any of
+                  its pixels is, with the mean color of the pixels in range (see
+                  scanline.reduce_band)
+    :param plane: frame plane holding the colors in the range color space
+    :param params: in_range_values() parameters, see range_params()
+    :return [height playpoints, color x playpoints, color y playpoints]
+    """
+    colors = frame.get_plane(plane)
+    mask, xpct, ypct = in_range_values(colors.reshape(-1, 3), **params)
+    if colors.ndim == 3:
+        shape = colors.shape[:2]
+        mask = mask.reshape(shape)
+        matches = np.maximum(mask.sum(axis=1), 1)
+        xpct = xpct.reshape(shape).sum(axis=1) / matches
+        ypct = ypct.reshape(shape).sum(axis=1) / matches
+        mask = mask.any(axis=1)
+    starts, ends = find_runs(mask)
+
+    return [
+        run_heights(starts, ends, len(frame)).tolist(),
+        run_means(xpct, starts, ends).tolist(),
+        run_means(ypct, starts, ends).tolist(),
+    ]
@@ -0,0 +1,121 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+
+import csv
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class LatencyRecorder:
+    """
+    keeps the most recent timings of each pipeline stage in fixed size ring buffers
+
+    each sample is the monotonic start time and the duration of a stage run, in
+    nanoseconds, recording never allocates, so it can stay enabled while playing
+    """
+
+    # scheduler step, layer stack render, playpoints extraction, event rendering, output
+    STAGES = ("step", "render", "process", "renderer", "play")
+    SIZE = 4096
+
+    def __init__(self, size=SIZE):
+        self.size = size
+        self._index = {stage: i for i, stage in enumerate(self.STAGES)}
+        self._start = np.zeros((len(self.STAGES), size), dtype=np.int64)
+        self._duration = np.zeros((len(self.STAGES), size), dtype=np.int64)
+        self._count = [0] * len(self.STAGES)
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._count = [0] * len(self.STAGES)
+
+    def record(self, stage, start, end):
+        """
+        :param start: stage start, from time.monotonic_ns()
+        :param end: stage end, from time.monotonic_ns()
+        """
+        s = self._index[stage]
+        with self._lock:
+            i = self._count[s] % self.size
+            self._start[s, i] = start
+            self._duration[s, i] = end - start
+            self._count[s] += 1
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.monotonic_ns()
+        try:
+            yield
+        finally:
+            self.record(stage, start, time.monotonic_ns())
+
+    def samples(self, stage) -> (np.ndarray, np.ndarray):
+        """
+        :return (start times, durations) of the buffered samples, oldest first
+        """
+        s = self._index[stage]
+        with self._lock:
+            count = self._count[s]
+            start = self._start[s].copy()
+            duration = self._duration[s].copy()
+        if count <= self.size:
+            return start[:count], duration[:count]
+        i = count % self.size
+        return np.roll(start, -i), np.roll(duration, -i)
+
+    def percentiles(self, stage, q=(50, 95, 99)) -> [float]:
+        """
+        :return the requested percentiles of the stage duration, in milliseconds (None if
+                there are no samples)
+        """
+        _, duration = self.samples(stage)
+        if len(duration) == 0:
+            return [None] * len(q)
+        return (np.percentile(duration, q) / 1e6).tolist()
+
+    def summary(self) -> {str: {str: float}}:
+        """
+        :return stage -> {samples count, p50, p95, p99 and max duration (milliseconds)}
+        """
+        out = {}
+        for stage in self.STAGES:
+            _, duration = self.samples(stage)
+            if len(duration) == 0:
+                continue
+            p50, p95, p99 = (np.percentile(duration, (50, 95, 99)) / 1e6).tolist()
+            out[stage] = {
+                "count": len(duration),
+                "p50": p50,
+                "p95": p95,
+                "p99": p99,
+                "max": int(duration.max()) / 1e6,
+            }
+        return out
+
+    def dump_csv(self, filename):
+        """
+        write all the buffered samples, sorted by start time, as stage,start_ns,duration_ns
+        """
+        rows = []
+        for stage in self.STAGES:
+            start, duration = self.samples(stage)
+            rows += zip([stage] * len(start), start.tolist(), duration.tolist())
+        rows.sort(key=lambda r: r[1])
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("stage", "start_ns", "duration_ns"))
+            writer.writerows(rows)
+
+
+# shared by all the pipeline stages
+recorder = LatencyRecorder()
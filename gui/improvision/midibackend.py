@@ -0,0 +1,195 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+
+import glob
+import os
+import threading
+import time
+
+_backends = {}
+_backend_instances = {}
+_backends_lock = threading.Lock()
+
+
+def register_backend(name, backend_class):
+    """
+    make a MidiBackend subclass available to get_backend()
+    """
+    _backends[name] = backend_class
+
+
+def get_backend(name) -> "MidiBackend":
+    """
+    :return the (shared) instance of the backend registered as name
+    """
+    with _backends_lock:
+        backend = _backend_instances.get(name)
+        if backend is None:
+            if name not in _backends:
+                raise KeyError("unknown MIDI backend '{}'".format(name))
+            backend = _backends[name]()
+            _backend_instances[name] = backend
+        return backend
+
+
+def get_backend_names() -> [str]:
+    return list(_backends)
+
+
+class MidiBackend:
+    """
+    a MIDI output API: enumerates the output devices and opens them
+
+    opened outputs only need a write(messages) method, taking a list of channel
+    messages (tuples of bytes, status first) to be sent together
+    """
+
+    def get_outputs(self) -> {str: int}:
+        """
+        :return output device name -> device id
+        """
+        raise NotImplementedError
+
+    def get_default_output(self) -> int:
+        """
+        :return the id of the default output device, None if there is none
+        """
+        outputs = self.get_outputs()
+        if len(outputs) > 0:
+            return next(iter(outputs.values()))
+        return None
+
+    def open(self, device_id):
+        raise NotImplementedError
+
+
+class PygameBackend(MidiBackend):
+    """
+    PortMidi outputs, through pygame.midi (imported when the backend is first used)
+    """
+
+    # pygame.midi.Output.write() limit
+    MAX_WRITE = 1024
+
+    def __init__(self):
+        from pygame import midi
+
+        self.midi = midi
+        if not midi.get_init():
+            midi.init()
+
+    def get_outputs(self) -> {str: int}:
+        outputs = {}
+        for did in range(self.midi.get_count()):
+            dev = self.midi.get_device_info(did)
+            if dev[3] == 1:
+                outputs[dev[1].decode()] = did
+        return outputs
+
+    def get_default_output(self) -> int:
+        device_id = self.midi.get_default_output_id()
+        return None if device_id < 0 else device_id
+
+    def open(self, device_id):
+        return PygameOutput(self.midi, device_id)
+
+
+class PygameOutput:
+    def __init__(self, midi, device_id):
+        self.midi = midi
+        self.output = midi.Output(device_id)
+
+    def write(self, messages):
+        timestamp = self.midi.time()
+        for i in range(0, len(messages), PygameBackend.MAX_WRITE):
+            self.output.write(
+                [
+                    [list(m), timestamp]
+                    for m in messages[i : i + PygameBackend.MAX_WRITE]
+                ]
+            )
+
+
+class RawMidiBackend(MidiBackend):
+    """
+    raw MIDI character devices (e.g. ALSA /dev/snd/midiC*D*), written as byte streams
+
+    being in charge of the byte stream, the backend applies running status itself
+    """
+
+    PATTERN = "/dev/snd/midiC*D*"
+
+    def get_outputs(self) -> {str: int}:
+        return {
+            os.path.basename(path): i
+            for i, path in enumerate(sorted(glob.glob(self.PATTERN)))
+        }
+
+    def open(self, device_id):
+        return RawMidiOutput(sorted(glob.glob(self.PATTERN))[device_id])
+
+
+class RawMidiOutput:
+    def __init__(self, path):
+        self.file = open(path, "wb", buffering=0)
+        self.running_status = None
+
+    def write(self, messages):
+        data = bytearray()
+        for m in messages:
+            if m[0] == self.running_status:
+                data += bytes(m[1:])
+            else:
+                data += bytes(m)
+                # system messages cancel running status
+                self.running_status = m[0] if m[0] < 0xF0 else None
+        self.file.write(data)
+
+
+class MemoryBackend(MidiBackend):
+    """
+    in-memory sink recording every written message with its time.monotonic_ns()
+    timestamp, for tests and benchmarks
+    """
+
+    def __init__(self):
+        self.outputs = {}
+
+    def get_outputs(self) -> {str: int}:
+        return {"Recorder": 0}
+
+    def open(self, device_id):
+        output = self.outputs.get(device_id)
+        if output is None:
+            output = self.outputs[device_id] = MemoryOutput()
+        return output
+
+
+class MemoryOutput:
+    def __init__(self):
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def write(self, messages):
+        timestamp = time.monotonic_ns()
+        with self._lock:
+            self.messages.extend((timestamp, tuple(m)) for m in messages)
+
+    def take(self) -> [(int, (int,))]:
+        """
+        :return the (timestamp, message) pairs recorded so far, clearing the record
+        """
+        with self._lock:
+            messages, self.messages = self.messages, []
+        return messages
+
+
+register_backend("pygame", PygameBackend)
+register_backend("rawmidi", RawMidiBackend)
+register_backend("memory", MemoryBackend)
@@ -0,0 +1,319 @@
+# coding=utf-8
+# Copyright (C) 2021 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""MIDI output of the played events
+
+the players and output threads here don't depend on GTK, so the headless engine can use
+them, the configurable GUI player is player.MidiPlayer
+"""
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from .event import Note, Event, ControlValue, ProgramChange, iter_bits, NO_CONTROLS
+from .smf import MidiFileWriter
+from .midibackend import get_backend
+
+_midi_devices = {}
+_midi_devices_lock = threading.Lock()
+
+
+class MidiOutputThread(threading.Thread):
+    """
+    owns a MIDI output device (opened through a midibackend) and writes to it from a
+    dedicated thread
+
+    players enqueue timestamped message batches and return immediately, so they never
+    wait for the driver, and all the writes to a device shared between players are
+    serialized by the single thread
+
+    the queue is bounded: if the device stalls for long enough to fill it, new batches
+    are dropped (and counted) instead of blocking the scanline
+    """
+
+    QUEUE_SIZE = 256
+
+    def __init__(self, backend, device_id):
+        super().__init__(daemon=True)
+        self.device_id = device_id
+        self.output = backend.open(device_id)
+        self.queue = queue.Queue(self.QUEUE_SIZE)
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._latency_sum = 0
+        self._latency_max = 0
+
+    def send(self, messages):
+        """
+        :param messages: list of channel messages (tuples of bytes, status first)
+        """
+        try:
+            self.queue.put_nowait((time.monotonic_ns(), messages))
+        except queue.Full:
+            self.dropped += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def stop(self):
+        self.queue.put((None, None))
+
+    def run(self):
+        while True:
+            enqueued, messages = self.queue.get()
+            if messages is None:
+                break
+            self.output.write(messages)
+            latency = time.monotonic_ns() - enqueued
+            self.sent += 1
+            self._latency_sum += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def stats(self) -> {str: float}:
+        """
+        :return current and max queue depth, sent and dropped batches, mean and max send
+                latency (from enqueue to write completion, in milliseconds)
+        """
+        return {
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "latency_mean": self._latency_sum / max(1, self.sent) / 1e6,
+            "latency_max": self._latency_max / 1e6,
+        }
+
+
+def get_output(device_id, backend="pygame") -> MidiOutputThread:
+    """
+    :return the (running) output thread of a device, shared by all its players
+    """
+    with _midi_devices_lock:
+        output = _midi_devices.get((backend, device_id))
+        if output is None:
+            output = MidiOutputThread(get_backend(backend), device_id)
+            output.start()
+            _midi_devices[(backend, device_id)] = output
+        return output
+
+
+def get_outputs() -> {(str, int): MidiOutputThread}:
+    """
+    :return the output threads opened so far, by (backend, device id)
+    """
+    with _midi_devices_lock:
+        return dict(_midi_devices)
+
+
+class EventPlayer:
+    """
+    turns a stream of events into the note on/off and control/program changes needed to
+    go from one event to the next
+
+    the sounding notes are kept as a bitmask of note numbers and the last sent control
+    values as a 128 slot array, so the diff of each step is a few integer operations;
+    the messages avoided because their note was already on or their control already at
+    the same value are counted in suppressed
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.active_mask = 0
+        self.active_controls = bytearray(NO_CONTROLS)
+        self.last_prog = None
+        self.suppressed = 0
+
+    def __del__(self):
+        self.stop()
+
+    @property
+    def active_notes(self) -> {Note}:
+        return {Note.get(n) for n in iter_bits(self.active_mask)}
+
+    def play(self, event: Event):
+        mask = event.note_mask
+        play_mask = mask & ~self.active_mask
+        stop_mask = self.active_mask & ~mask
+        self.suppressed += bin(mask & self.active_mask).count("1")
+
+        if play_mask:
+            self.notes_on({event.get_note(n) for n in iter_bits(play_mask)})
+        if stop_mask:
+            self.notes_off({Note.get(n) for n in iter_bits(stop_mask)})
+        self.active_mask = mask
+
+        for control, value in event.iter_controls():
+            if self.active_controls[control] != value:
+                self.send_cc(ControlValue.get(control, value))
+                self.active_controls[control] = value
+            else:
+                self.suppressed += 1
+
+        if event.program is not None:
+            if event.program != self.last_prog:
+                self.send_pc(event.program)
+                self.last_prog = event.program
+            else:
+                self.suppressed += 1
+
+    def stop(self):
+        if self.active_mask:
+            self.notes_off(self.active_notes)
+        self.active_mask = 0
+
+    def notes_on(self, notes: set[Note]):
+        raise NotImplementedError
+
+    def notes_off(self, notes: set[Note]):
+        raise NotImplementedError
+
+    def send_cc(self, control: ControlValue):
+        raise NotImplementedError
+
+    def send_pc(self, program: ProgramChange):
+        raise NotImplementedError
+
+
+class LogPlayer(EventPlayer):
+    def __init__(self):
+        super().__init__()
+
+    def notes_on(self, notes: set[Note]):
+        print("notes on: {}, active_notes: {}".format(notes, self.active_notes))
+
+    def notes_off(self, notes: set[Note]):
+        print("notes off: {}, active_notes: {}".format(notes, self.active_notes))
+
+    def send_cc(self, control):
+        print(f"control change: {control}")
+
+    def send_pc(self, program):
+        print(f"program change: {program}")
+
+
+class MidiOutputPlayer(EventPlayer):
+    """
+    sends the messages of each step to a MIDI output device (see get_output) as a
+    single batch
+
+    subclasses provide the channel attribute (1~16)
+    """
+
+    _batch = None
+
+    def __init__(self, backend="pygame"):
+        super().__init__()
+        self.output = None
+        self.backend = backend
+        self._lock = threading.RLock()
+
+    def set_device(self, device_id):
+        self.output = get_output(int(device_id), self.backend)
+
+    def play(self, event: Event):
+        with self._batching():
+            super().play(event)
+
+    def stop(self):
+        with self._batching():
+            super().stop()
+
+    @contextmanager
+    def _batching(self):
+        """
+        collect the messages sent while the context is active and flush them as a
+        single batch, so all the messages of a step reach the device together
+
+        the messages of a step are simultaneous, so they are grouped by status byte (note
+        offs first), letting the driver use running status on the wire
+
+        play() runs on the scanline threads while stop() can come from the GTK thread,
+        the lock keeps their diffs (and batches) from interleaving
+        """
+        with self._lock:
+            batch = self._batch = []
+            try:
+                yield
+            finally:
+                self._batch = None
+                batch.sort(key=lambda m: m[0])
+                self._write(batch)
+
+    def _send(self, message: (int,)):
+        if self._batch is not None:
+            self._batch.append(message)
+        else:
+            self._write([message])
+
+    def _write(self, messages):
+        if len(messages) > 0 and self.output is not None:
+            self.output.send(messages)
+
+    def notes_on(self, notes: set[Note]):
+        status = 0x90 + int(self.channel) - 1
+        for n in sorted(notes):
+            self._send((status, n.note, n.velocity))
+
+    def notes_off(self, notes: set[Note]):
+        status = 0x80 + int(self.channel) - 1
+        for n in sorted(notes):
+            self._send((status, n.note, 0))
+
+    def send_cc(self, control: ControlValue):
+        self._send((0xB0 + int(self.channel) - 1, control.control, control.value))
+
+    def send_pc(self, program: ProgramChange):
+        self._send((0xC0 + int(self.channel) - 1, program.program))
+
+
+class PortMidiPlayer(MidiOutputPlayer):
+    """
+    player bound to a fixed device and channel, usable without the GUI
+
+    despite the name, the device can be opened through any registered midibackend
+    """
+
+    def __init__(self, channel=1, device_id=None, backend="pygame"):
+        super().__init__(backend)
+        if device_id is None:
+            device_id = get_backend(backend).get_default_output()
+        self.channel = channel
+        self.set_device(device_id)
+
+
+class MidiFilePlayer(EventPlayer):
+    """
+    records the played events into a MidiFileWriter
+
+    messages are timestamped with the value returned by clock (in seconds)
+    """
+
+    def __init__(self, writer: MidiFileWriter, clock, channel=1):
+        super().__init__()
+        self.writer = writer
+        self.clock = clock
+        self.channel = channel
+
+    def notes_on(self, notes: set[Note]):
+        status = 0x90 + int(self.channel) - 1
+        for n in sorted(notes):
+            self.writer.add(self.clock(), (status, n.note, n.velocity))
+
+    def notes_off(self, notes: set[Note]):
+        status = 0x80 + int(self.channel) - 1
+        for n in sorted(notes):
+            self.writer.add(self.clock(), (status, n.note, 0))
+
+    def send_cc(self, control: ControlValue):
+        status = 0xB0 + int(self.channel) - 1
+        self.writer.add(self.clock(), (status, control.control, control.value))
+
+    def send_pc(self, program: ProgramChange):
+        status = 0xC0 + int(self.channel) - 1
+        self.writer.add(self.clock(), (status, program.program))
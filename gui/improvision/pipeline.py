@@ -0,0 +1,257 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+
+import threading
+from collections import OrderedDict
+
+
+class LookaheadBuffer:
+    """
+    bounded buffer of columns analyzed ahead of the scanline
+
+    a worker fills the buffer with the events of the next columns the scanline will
+    reach, the scheduler takes them out when their step is due, so the output only lags
+    by the time needed to send the events, independently of the render and analysis cost
+    """
+
+    def __init__(self, size=0):
+        self._slots = OrderedDict()
+        self._cond = threading.Condition()
+        self.size = size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, column):
+        return column in self._slots
+
+    def resize(self, size):
+        with self._cond:
+            self.size = size
+            while len(self._slots) > size:
+                self._slots.popitem(last=False)
+            self._cond.notify_all()
+
+    def clear(self):
+        with self._cond:
+            self._slots.clear()
+            self.generation += 1
+            self._cond.notify_all()
+
+    def invalidate(self, x, w):
+        """
+        drop the buffered columns from x to x + w (all of them if w <= 0)
+        """
+        with self._cond:
+            self.generation += 1
+            if w <= 0:
+                self._slots.clear()
+            else:
+                for column in [c for c in self._slots if x <= c < x + w]:
+                    del self._slots[column]
+            self._cond.notify_all()
+
+    def retain(self, columns):
+        """
+        drop all the buffered columns that are not in columns (the scanline moved past them)
+        """
+        with self._cond:
+            for column in [c for c in self._slots if c not in columns]:
+                del self._slots[column]
+
+    def put(self, column, events, generation):
+        """
+        :param generation: buffer generation read before the column was analyzed,
+                           the events are discarded if the buffer was invalidated since
+        """
+        with self._cond:
+            if generation != self.generation:
+                return
+            self._slots[column] = events
+            while len(self._slots) > self.size:
+                self._slots.popitem(last=False)
+            self._cond.notify_all()
+
+    def take(self, column):
+        """
+        :return the buffered events of column (removing them), None if not available
+        """
+        with self._cond:
+            events = self._slots.pop(column, None)
+            if events is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._cond.notify_all()
+            return events
+
+    def wait(self, timeout=None):
+        """
+        block until the buffer content changes (or timeout expires)
+        """
+        with self._cond:
+            self._cond.wait(timeout)
+
+
+class RingReader:
+    """
+    read position of a consumer in a FrameRing, with the counters of the frames the
+    consumer skipped because it fell behind
+    """
+
+    def __init__(self, ring, consumer, cursor):
+        self.ring = ring
+        self.consumer = consumer
+        self.cursor = cursor
+        self.busy = False
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def detach(self):
+        self.ring.detach(self)
+
+    def stats(self) -> {str: int}:
+        return {
+            "pending": max(0, self.ring.head - self.cursor),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+class FrameRing:
+    """
+    broadcast ring buffer of scanline frames, consumed by a fixed pool of worker threads
+
+    the producer publishes each item once, every attached consumer reads it through its
+    own RingReader, a worker takes the next pending item of any idle consumer, so each
+    consumer still sees its items in order, one at a time, while different consumers run
+    in parallel
+
+    consumers are objects with enabled and input_policy attributes and a consume(item)
+    method, input_policy tells what to do when the consumer falls behind:
+
+    - "latest": skip to the newest item, the skipped ones are coalesced
+    - "bounded": keep up to size items, the oldest are dropped when overwritten
+    - "block": keep up to size items, the producer waits for the consumer
+
+    items describe the whole state of a step, so skipping stale items only loses
+    their intermediate states, while keeping up with the scanline
+    """
+
+    POLICIES = ("latest", "bounded", "block")
+    DEFAULT_WORKERS = 4
+
+    def __init__(self, size=8, workers=DEFAULT_WORKERS):
+        self.size = size
+        self.workers = workers
+        self.head = 0
+        self._items = [None] * size
+        self._readers = []
+        self._next_reader = 0
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        if len(self._threads) > 0:
+            return
+        for _ in range(self.workers):
+            t = threading.Thread(target=self._work, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def attach(self, consumer) -> RingReader:
+        """
+        :return the consumer reader, the consumer only receives items published from now on
+        """
+        with self._cond:
+            reader = RingReader(self, consumer, self.head)
+            self._readers.append(reader)
+            return reader
+
+    def detach(self, reader: RingReader):
+        """
+        stop feeding the consumer, waiting for the item it is processing (if any)
+        """
+        with self._cond:
+            if reader in self._readers:
+                self._readers.remove(reader)
+            while reader.busy:
+                self._cond.wait()
+            self._cond.notify_all()
+
+    def _behind(self, reader):
+        consumer = reader.consumer
+        return (
+            consumer.enabled
+            and consumer.input_policy == "block"
+            and self.head - reader.cursor >= self.size
+        )
+
+    def publish(self, item):
+        """
+        broadcast item to all the attached consumers
+        """
+        with self._cond:
+            while any(self._behind(r) for r in self._readers):
+                # consumers may be disabled meanwhile, without notifying the ring
+                self._cond.wait(timeout=0.1)
+            self._items[self.head % self.size] = item
+            self.head += 1
+            self._cond.notify_all()
+
+    def _take(self):
+        """
+        :return (reader, item) of the next consumer with pending items, None if there
+                are none, must be called holding the lock
+        """
+        count = len(self._readers)
+        for i in range(count):
+            reader = self._readers[(self._next_reader + i) % count]
+            if reader.busy or reader.cursor >= self.head:
+                continue
+            consumer = reader.consumer
+            lag = self.head - reader.cursor
+            if not consumer.enabled:
+                reader.cursor = self.head
+                continue
+            if consumer.input_policy == "latest":
+                reader.coalesced += lag - 1
+                reader.cursor = self.head - 1
+            elif lag > self.size:
+                reader.dropped += lag - self.size
+                reader.cursor = self.head - self.size
+            item = self._items[reader.cursor % self.size]
+            reader.cursor += 1
+            reader.processed += 1
+            reader.busy = True
+            # start from the next consumer on the following take, for fairness
+            self._next_reader = (self._next_reader + i + 1) % count
+            return reader, item
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                taken = self._take()
+                while taken is None:
+                    self._cond.wait()
+                    taken = self._take()
+            reader, item = taken
+            try:
+                reader.consumer.consume(item)
+            except Exception as e:
+                print("error processing scanline: {}".format(e))
+            with self._cond:
+                reader.busy = False
+                self._cond.notify_all()
@@ -0,0 +1,132 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Worker processes for the playpoint kernels
+
+like kernels, this module must not depend on GTK: it is imported by the workers
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .scanline import ScanlineFrame
+
+# worker side: slot index -> the shared memory segment currently attached for it
+_attached = {}
+
+
+def _attach(slot, name) -> shared_memory.SharedMemory:
+    """
+    :return the segment of a slot, slots get a new segment when they grow, the
+            previous one is closed, so its memory can be released once unlinked
+    """
+    shm = _attached.get(slot)
+    if shm is not None and shm.name != name:
+        shm.close()
+        shm = None
+    if shm is None:
+        shm = _attached[slot] = shared_memory.SharedMemory(name)
+    return shm
+
+
+def _run_kernel(slot, name, shape, kernel, params):
+    shm = _attach(slot, name)
+    rgb = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    return kernel(ScanlineFrame(rgb), **params)
+
+
+class _Slot:
+    def __init__(self, index):
+        self.index = index
+        self.shm = None
+        self.shape = None
+        self.frame = None
+        self.users = 0
+
+    def store(self, frame: ScanlineFrame):
+        rgb = frame.rgb
+        if self.shm is None or self.shm.size < rgb.nbytes:
+            self.free()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, rgb.nbytes))
+        self.shape = rgb.shape
+        np.ndarray(rgb.shape, dtype=np.float32, buffer=self.shm.buf)[:] = rgb
+        self.frame = frame
+
+    def free(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+        self.frame = None
+
+
+class KernelPool:
+    """
+    runs playpoint kernels (see kernels) in worker processes
+
+    each scanline is copied once into a shared memory slot, shared by all the kernels
+    run on it, the workers attach to the slot and only the playpoint lists are sent back;
+    the calling thread waits for the result without holding the GIL
+    """
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = max(1, (os.cpu_count() or 2) - 1)
+        # workers are started fresh, forking the GTK process is not safe
+        self._executor = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._slots = [_Slot(i) for i in range(workers * 2)]
+        self._cond = threading.Condition()
+
+    def _acquire(self, frame) -> _Slot:
+        with self._cond:
+            while True:
+                free = None
+                for slot in self._slots:
+                    if slot.frame is frame:
+                        slot.users += 1
+                        return slot
+                    if slot.users == 0 and free is None:
+                        free = slot
+                if free is not None:
+                    free.store(frame)
+                    free.users = 1
+                    return free
+                self._cond.wait()
+
+    def _release(self, slot):
+        with self._cond:
+            slot.users -= 1
+            self._cond.notify_all()
+
+    def run(self, frame: ScanlineFrame, kernel, params) -> [[float]]:
+        """
+        :param kernel: module level function of a ScanlineFrame and params
+        :param params: kernel keyword arguments, they must be picklable
+        :return the kernel result
+        """
+        slot = self._acquire(frame)
+        try:
+            future = self._executor.submit(
+                _run_kernel, slot.index, slot.shm.name, slot.shape, kernel, params
+            )
+            return future.result()
+        finally:
+            self._release(slot)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._cond:
+            for slot in self._slots:
+                slot.free()
@@ -0,0 +1,290 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from lib.helpers import gdkpixbuf2numpy
+from lib.observable import event
+from lib.tiledsurface import TILE_SIZE, MAX_MIPMAP_LEVEL
+from .scanline import ScanlineFrame
+from .latency import recorder
+
+
+def _to_float(rgb):
+    """
+    :return the uint8 colors as float32 values (0~1)
+    """
+    rgb = rgb.astype(np.float32)
+    rgb /= 255
+    return rgb
+
+
+class ScanlineSampler:
+    """
+    serves single pixel columns of the frame out of cached tile columns
+
+    the layer stack can only render whole tiles, so asking for a single pixel column
+    means compositing a TILE_SIZE wide strip anyway: the sampler renders each strip once,
+    keeps it around until the layers are changed under it and slices all the successive
+    scanlines out of the cached copy
+
+    strips are stored as (H, TILE_SIZE, 3) uint8 arrays, the scanlines sliced out of them
+    are converted to float32 one by one; the cache is bounded by max_bytes, the least
+    recently used strips are dropped first
+
+    with a mipmap level above 0 the strips are rendered downscaled by 2 ** level in both
+    directions, a scanline then has fewer pixels, but the playpoints are relative to the
+    scanline length, so their positions don't change
+    """
+
+    # default cache size, about 90 megapixels
+    MAX_CACHE_BYTES = 256 * 1024 * 1024
+    # most strips rendered by a single prefetch() call to the layer stack
+    PREFETCH_TILES = 16
+
+    def __init__(self, layers, max_bytes=MAX_CACHE_BYTES):
+        """
+        :param layers: the root layer stack to be rendered
+        :type layers: lib.layer.tree.RootLayerStack
+        :param max_bytes: cached strips size limit
+        """
+        self._layers = layers
+        self._lock = threading.Lock()
+        # tile column index (at mipmap_level) -> (y, h, rgb array), least recently
+        # used first
+        self._strips = OrderedDict()
+        self._bytes = 0
+        self.max_bytes = max_bytes
+        self._generation = 0
+        self.mipmap_level = 0
+        layers.layer_content_changed += self._layer_content_changed_cb
+
+    def _layer_content_changed_cb(self, root, layer, x, y, w, h):
+        with self._lock:
+            self._generation += 1
+            if w <= 0 or h <= 0:
+                self._clear_strips()
+            else:
+                level = self.mipmap_level
+                tx0 = (x >> level) // TILE_SIZE
+                tx1 = ((x + w) >> level) // TILE_SIZE
+                for tx in range(tx0, tx1 + 1):
+                    self._drop_strip(tx)
+        self.content_changed(x, w if h > 0 else 0)
+
+    @event
+    def content_changed(self, x, w):
+        """Event: the columns from x to x + w were dropped from the cache
+
+        fired after the cached strips are gone, so anything sampled from now on
+        reflects the change; w <= 0 means that all the columns changed
+        """
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._clear_strips()
+
+    @property
+    def cache_bytes(self):
+        return self._bytes
+
+    # the following must be called holding the lock
+
+    def _clear_strips(self):
+        self._strips.clear()
+        self._bytes = 0
+
+    def _drop_strip(self, tx):
+        strip = self._strips.pop(tx, None)
+        if strip is not None:
+            self._bytes -= strip[2].nbytes
+
+    def _store_strip(self, tx, strip):
+        self._drop_strip(tx)
+        self._strips[tx] = strip
+        self._bytes += strip[2].nbytes
+        # the strip just stored is kept even if it doesn't fit
+        while self._bytes > self.max_bytes and len(self._strips) > 1:
+            _, old = self._strips.popitem(last=False)
+            self._bytes -= old[2].nbytes
+
+    def _lookup_strip(self, tx, y, h):
+        """
+        :return the cached strip, if it covers rows y to y + h
+        """
+        strip = self._strips.get(tx)
+        if strip is None or strip[0] != y or strip[1] != h:
+            return None
+        self._strips.move_to_end(tx)
+        return strip
+
+    def set_mipmap_level(self, level):
+        """
+        :param level: render downscale degree, 0 is full resolution, see
+                      lib.layer.tree.RootLayerStack.render()
+        """
+        level = min(max(0, int(level)), MAX_MIPMAP_LEVEL)
+        with self._lock:
+            if level == self.mipmap_level:
+                return
+            self._generation += 1
+            self._clear_strips()
+            self.mipmap_level = level
+        self.content_changed(0, 0)
+
+    def _scale(self, x, y, w, h):
+        """
+        :return the area (x, y, w, h) in mipmap level coordinates, rows and columns
+                partially covering the area are included
+        """
+        level = self.mipmap_level
+        lx = x >> level
+        ly = y >> level
+        lw = max(1, -(-(x + w) >> level) - lx)
+        lh = max(1, -(-(y + h) >> level) - ly)
+        return lx, ly, lw, lh
+
+    def _get_strip(self, tx, y, h, level):
+        with self._lock:
+            generation = self._generation
+            if level == self.mipmap_level:
+                strip = self._lookup_strip(tx, y, h)
+            else:
+                # the level changed after the area was scaled, don't cache this strip
+                strip = generation = None
+        if strip is not None:
+            return strip
+
+        rgb = self._render(tx * TILE_SIZE, y, TILE_SIZE, h, level)
+        strip = (y, h, rgb)
+        with self._lock:
+            # don't cache a strip that was invalidated while we were rendering it
+            if generation == self._generation:
+                self._store_strip(tx, strip)
+        return strip
+
+    def _render(self, x, y, w, h, level=0):
+        """
+        :param level: mipmap level, the area is in the level coordinates
+        :return (h, w, 3) uint8 array, not bound to the rendered pixbuf
+        """
+        with recorder.measure("render"):
+            pixbuf = self._layers.render_layer_as_pixbuf(
+                self._layers, (x, y, w, h), mipmap_level=level
+            )
+        n_channels = pixbuf.get_n_channels()
+        assert n_channels in (3, 4)
+        return np.array(gdkpixbuf2numpy(pixbuf)[:h, :w, :3])
+
+    def prefetch(self, x, y, w, h):
+        """
+        render the strips covering an area that are not cached yet with as few calls
+        to the layer stack as possible, each call renders up to PREFETCH_TILES strips
+        """
+        with self._lock:
+            level = self.mipmap_level
+            x, y, w, h = self._scale(x, y, w, h)
+            generation = self._generation
+            missing = [
+                tx
+                for tx in range(x // TILE_SIZE, (x + w - 1) // TILE_SIZE + 1)
+                if self._lookup_strip(tx, y, h) is None
+            ]
+        # runs of adjacent missing strips, split every PREFETCH_TILES
+        runs = []
+        for tx in missing:
+            if len(runs) > 0:
+                tx0, count = runs[-1]
+                if tx == tx0 + count and count < self.PREFETCH_TILES:
+                    runs[-1] = (tx0, count + 1)
+                    continue
+            runs.append((tx, 1))
+        for tx0, count in runs:
+            rgb = self._render(tx0 * TILE_SIZE, y, count * TILE_SIZE, h, level)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                for tx in range(tx0, tx0 + count):
+                    i = (tx - tx0) * TILE_SIZE
+                    # copied, a strip must not keep the whole render alive
+                    strip = rgb[:, i : i + TILE_SIZE, :].copy()
+                    self._store_strip(tx, (y, h, strip))
+
+    def sample(self, x, y, h) -> ScanlineFrame:
+        """
+        get the colors of a single pixel column
+
+        :param x: model x coordinate of the column
+        :param y: model y coordinate of the topmost pixel
+        :param h: number of pixels to read
+        :return the column colors (from top to bottom) wrapped in a ScanlineFrame, the
+                column is h >> mipmap_level pixels long
+        """
+        with self._lock:
+            level = self.mipmap_level
+            x, y, _, h = self._scale(x, y, 1, h)
+        tx = x // TILE_SIZE
+        _, _, rgb = self._get_strip(tx, y, h, level)
+        return ScanlineFrame(_to_float(rgb[:, x - tx * TILE_SIZE, :]))
+
+    def sample_block(self, x, y, w, h) -> ScanlineFrame:
+        """
+        get the colors of a range of adjacent pixel columns, see ScanlineFrame.columns()
+
+        :param x: model x coordinate of the leftmost column
+        :param w: number of columns
+        :return (H, W, 3) colors wrapped in a ScanlineFrame, both scaled by the
+                mipmap_level
+        """
+        with self._lock:
+            level = self.mipmap_level
+            x, y, w, h = self._scale(x, y, w, h)
+        tx0 = x // TILE_SIZE
+        tx1 = (x + w - 1) // TILE_SIZE
+        strips = [self._get_strip(tx, y, h, level)[2] for tx in range(tx0, tx1 + 1)]
+        rgb = strips[0] if len(strips) == 1 else np.concatenate(strips, axis=1)
+        i = x - tx0 * TILE_SIZE
+        return ScanlineFrame(_to_float(rgb[:, i : i + w, :]))
+
+    def sample_spans(self, spans, y, h) -> ScanlineFrame:
+        """
+        get the colors of several ranges of adjacent pixel columns, see sample_block()
+
+        :param spans: (x, w) model column ranges
+        :return (H, W, 3) colors of all the columns, in spans order
+        """
+        blocks = [self.sample_block(x, y, w, h).rgb for x, w in spans]
+        if len(blocks) == 1:
+            return ScanlineFrame(blocks[0])
+        return ScanlineFrame(np.concatenate(blocks, axis=1))
+
+    def sample_columns(self, x, y, w, h, planes=()) -> [ScanlineFrame]:
+        """
+        get the colors of a range of adjacent pixel columns as separate scanlines,
+        rendered together and sharing the plane conversions
+
+        :param planes: names of the planes to convert once for all the columns
+        :return one ScanlineFrame for each model column, columns falling on the same
+                mipmap level pixel share the frame
+        """
+        with self._lock:
+            level = self.mipmap_level
+        block = self.sample_block(x, y, w, h)
+        for name in planes:
+            block.get_plane(name)
+        columns = block.columns()
+        last = len(columns) - 1
+        # the level may change meanwhile, never index out of the block
+        return [
+            columns[min(((x + i) >> level) - (x >> level), last)] for i in range(w)
+        ]
@@ -0,0 +1,270 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+
+import threading
+
+import numpy as np
+
+# same weights used by lib.color.UIColor.get_luma()
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# same weights used by lib.color.RGB_to_HCY()
+_HCY_LUMA_WEIGHTS = np.array([0.3, 0.59, 0.11], dtype=np.float32)
+
+# same matrix used by lib.color.RGB_to_YCbCr_BT601()
+_YCBCR_MATRIX = np.array(
+    [
+        [0.299, -0.169, 0.500],
+        [0.587, -0.331, -0.419],
+        [0.114, 0.500, -0.081],
+    ],
+    dtype=np.float32,
+)
+
+
+def rgb_to_hsv(rgb):
+    """
+    vectorized version of colorsys.rgb_to_hsv
+    :param rgb: (N, 3) array of rgb values (0~1)
+    :return (N, 3) float32 array of hsv values (0~1)
+    """
+    rgb = np.asarray(rgb, dtype=np.float32)
+    if rgb.ndim == 1:
+        return rgb_to_hsv(rgb[np.newaxis])[0]
+    r = rgb[..., 0]
+    g = rgb[..., 1]
+    b = rgb[..., 2]
+    maxc = np.maximum(np.maximum(r, g), b)
+    rangec = maxc - np.minimum(np.minimum(r, g), b)
+    grey = rangec == 0
+    # grey pixels get 0 hue and saturation, just keep them from dividing by 0
+    rangec[grey] = 1
+
+    # the hue sector depends on the max channel, blue unless red or green are
+    num = r - g
+    offset = np.full(maxc.shape, 4, dtype=np.float32)
+    gmax = g == maxc
+    np.subtract(b, r, out=num, where=gmax)
+    offset[gmax] = 2
+    rmax = r == maxc
+    np.subtract(g, b, out=num, where=rmax)
+    offset[rmax] = 0
+
+    hsv = np.empty(rgb.shape, dtype=np.float32)
+    h = num / rangec
+    h += offset
+    h /= 6
+    h %= 1
+    h[grey] = 0
+    hsv[..., 0] = h
+    sat = rangec / np.where(grey, 1, maxc)
+    sat[grey] = 0
+    hsv[..., 1] = sat
+    hsv[..., 2] = maxc
+    return hsv
+
+
+def rgb_to_luma(rgb):
+    """
+    :param rgb: (N, 3) array of rgb values (0~1)
+    :return (N,) float32 array of luma values, see lib.color.UIColor.get_luma()
+    """
+    return np.asarray(rgb, dtype=np.float32) @ _LUMA_WEIGHTS
+
+
+def rgb_to_hcy_luma(rgb):
+    """
+    :param rgb: (N, 3) array of rgb values (0~1)
+    :return (N,) float32 array of HCY luma values, see lib.color.RGB_to_HCY()
+    """
+    return np.asarray(rgb, dtype=np.float32) @ _HCY_LUMA_WEIGHTS
+
+
+def rgb_to_ycbcr(rgb):
+    """
+    vectorized version of lib.color.RGB_to_YCbCr_BT601
+    :param rgb: (N, 3) array of rgb values (0~1)
+    :return (N, 3) float32 array of Y (0~1), Cb and Cr (-0.5~0.5) values
+    """
+    return np.asarray(rgb, dtype=np.float32) @ _YCBCR_MATRIX
+
+
+def find_runs(mask):
+    """
+    find the contiguous runs of True values in a boolean array
+    :param mask: (N,) boolean array
+    :return (starts, ends) index arrays, ends are exclusive
+    """
+    edges = np.flatnonzero(np.diff(mask, prepend=False, append=False))
+    return edges[0::2], edges[1::2]
+
+
+def run_means(values, starts, ends):
+    """
+    average values over each run
+    :param values: (N,) array
+    :param starts: run start indexes, as returned by find_runs
+    :param ends: run (exclusive) end indexes, as returned by find_runs
+    :return (len(starts),) float array of the mean value of each run
+    """
+    if len(starts) == 0:
+        return np.empty(0)
+    bounds = np.column_stack((starts, ends)).ravel()
+    if bounds[-1] == len(values):
+        # reduceat can't take len(values) as an index, the last run simply extends to the end
+        bounds = bounds[:-1]
+    sums = np.add.reduceat(values, bounds, dtype=np.float64)[0::2]
+    return sums / (ends - starts)
+
+
+def run_heights(starts, ends, size):
+    """
+    get the height playpoint of each run, the centroid of the run mapped so that the top
+    of the column is 1 and the bottom is 0
+    :param starts: run start indexes, as returned by find_runs
+    :param ends: run (exclusive) end indexes, as returned by find_runs
+    :param size: total column length
+    :return (len(starts),) float array
+    """
+    return 1 - ((starts + ends - 1) / 2) / size
+
+
+class ScanlineFrame:
+    """
+    color data of a single scanline step
+
+    the rgb values are kept as a (H, 3) float32 array (rows from top to bottom), other
+    representations (planes) are derived from it the first time they are requested and
+    memoized, so that all the consumers fed with the same frame share the conversion work
+
+    a frame is shared between consumer threads, all its planes are read-only
+    """
+
+    # plane name -> conversion from the rgb plane
+    converters = {
+        "luma": rgb_to_luma,
+        "hcy_luma": rgb_to_hcy_luma,
+        "hsv": rgb_to_hsv,
+        "ycbcr": rgb_to_ycbcr,
+    }
+
+    def __init__(self, rgb):
+        """
+        :param rgb: (H, 3) float32 array of rgb values (0~1), or a (H, W, 3) block of
+                    adjacent columns, see columns()
+        """
+        if rgb.flags.writeable:
+            rgb = rgb.view()
+            rgb.setflags(write=False)
+        self._planes = {"rgb": rgb}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._planes["rgb"])
+
+    def columns(self) -> ["ScanlineFrame"]:
+        """
+        split a frame holding a (H, W, 3) block of adjacent columns into W single column
+        frames, the planes computed on the block so far are shared (sliced) by the columns,
+        so a plane can be converted once for the whole block
+        """
+        planes = dict(self._planes)
+        frames = []
+        for i in range(planes["rgb"].shape[1]):
+            frame = ScanlineFrame(planes["rgb"][:, i])
+            frame._planes.update((name, p[:, i]) for name, p in planes.items())
+            frames.append(frame)
+        return frames
+
+    def get_plane(self, name):
+        """
+        get a color plane, computing it if needed
+        :param name: one of "rgb" or the keys of ScanlineFrame.converters
+        :return read-only (H,) or (H, 3) float32 array
+        """
+        plane = self._planes.get(name)
+        if plane is None:
+            with self._lock:
+                plane = self._planes.get(name)
+                if plane is None:
+                    plane = self.converters[name](self._planes["rgb"])
+                    plane.setflags(write=False)
+                    self._planes[name] = plane
+        return plane
+
+    @property
+    def rgb(self):
+        """(H, 3) float32 array of rgb values"""
+        return self._planes["rgb"]
+
+    @property
+    def luma(self):
+        """(H,) float32 array of luma values, see lib.color.UIColor.get_luma()"""
+        return self.get_plane("luma")
+
+    @property
+    def hcy_luma(self):
+        """(H,) float32 array of HCY luma values"""
+        return self.get_plane("hcy_luma")
+
+    @property
+    def hsv(self):
+        """(H, 3) float32 array of hsv values"""
+        return self.get_plane("hsv")
+
+    @property
+    def ycbcr(self):
+        """(H, 3) float32 array of BT601 YCbCr values"""
+        return self.get_plane("ycbcr")
+
+
+# ways of merging a band of adjacent columns into a single analysis column
+BAND_REDUCTIONS = ("max", "mean", "any")
+
+
+def reduce_band(frame: ScanlineFrame, mode) -> ScanlineFrame:
+    """
+    merge the columns of a (H, W, 3) block frame (see ScanlineSampler.sample_block)
+    :param mode: "max" keeps the most inked pixel of each row (the farthest from white),
+                 "mean" averages each row, "any" keeps the whole block: the kernels
+                 reduce blocks themselves, a row matches if any of its pixels does
+    :return the merged (H, 3) frame, or frame itself for "any"
+    """
+    if mode == "any":
+        return frame
+    rgb = frame.rgb
+    if mode == "mean":
+        return ScanlineFrame(rgb.mean(axis=1, dtype=np.float32))
+    if mode == "max":
+        ink = rgb.sum(axis=2).argmin(axis=1)
+        return ScanlineFrame(rgb[np.arange(len(rgb)), ink])
+    raise ValueError("unknown band reduction '{}'".format(mode))
+
+
+def band_spans(previous, step, width) -> [(int, int)]:
+    """
+    get the columns swept by the scanline moving from one step to the next, the frame
+    is scanned left to right and the scanline wraps back to column 0 after the last one
+
+    :param previous: frame relative column of the previous step, None if there is none
+    :param step: frame relative column of the current step
+    :param width: frame width
+    :return (start, count) spans of frame relative columns, from previous (excluded)
+            to step (included)
+
+    >>> band_spans(None, 5, 10), band_spans(2, 8, 10), band_spans(8, 1, 10)
+    ([(5, 1)], [(3, 6)], [(9, 1), (0, 2)])
+    """
+    if previous is None or previous < 0 or previous == step:
+        return [(step, 1)]
+    previous = min(previous, width - 1)
+    if step > previous:
+        return [(previous + 1, step - previous)]
+    spans = [(previous + 1, width - previous - 1), (0, step + 1)]
+    return [s for s in spans if s[1] > 0]
@@ -0,0 +1,110 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+
+import math
+import time
+
+
+class ScanlineClock:
+    """
+    drift free clock for the scanline steps
+
+    deadlines are computed on an absolute grid (origin + tick * period) read from
+    time.monotonic_ns(), so the time spent processing a step is not added to the sleep
+    that follows it; when the clock wakes up later than one whole period, the missed
+    ticks are coalesced in a single wake up and reported to the caller, which can then
+    skip the corresponding steps
+
+    each wake up records how late it happened (drift), the clock keeps running statistics
+    of the drift since the last reset
+    """
+
+    # the last part of the wait is spent spinning, to make up for the coarse
+    # granularity of the system timers
+    SPIN_NS = 500000
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        restart the clock, the next wait will anchor the grid to the current time
+        """
+        self._origin = None
+        self._period = None
+        self._tick = 0
+        self.steps = 0
+        self.skipped = 0
+        self._drift_mean = 0.0
+        self._drift_m2 = 0.0
+        self._drift_max = 0
+
+    def _anchor(self, period, now):
+        if self._origin is None:
+            self._origin = now
+        elif period != self._period:
+            # keep the current position on the grid and only change its pace from here on
+            self._origin += self._tick * self._period
+        else:
+            return
+        self._period = period
+        self._tick = 0
+
+    def _record(self, drift):
+        self.steps += 1
+        delta = drift - self._drift_mean
+        self._drift_mean += delta / self.steps
+        self._drift_m2 += delta * (drift - self._drift_mean)
+        self._drift_max = max(self._drift_max, drift)
+
+    def wait(self, period: float, sleeper) -> int:
+        """
+        sleep until the next tick
+        :param period: tick duration, in seconds
+        :param sleeper: threading.Event, setting it interrupts the wait
+        :return the number of ticks elapsed since the previous wait (more than 1 if the
+                clock is running late and some ticks were coalesced), 0 if interrupted
+        """
+        period = max(1, int(period * 1e9))
+        self._anchor(period, time.monotonic_ns())
+
+        deadline = self._origin + (self._tick + 1) * period
+        remaining = deadline - time.monotonic_ns()
+        if remaining > self.SPIN_NS:
+            if sleeper.wait(timeout=(remaining - self.SPIN_NS) / 1e9):
+                return 0
+        now = time.monotonic_ns()
+        while now < deadline:
+            if sleeper.is_set():
+                return 0
+            time.sleep(0)
+            now = time.monotonic_ns()
+
+        target = (now - self._origin) // period
+        ticks = target - self._tick
+        self._tick = target
+        self.skipped += ticks - 1
+        self._record(now - deadline)
+        return ticks
+
+    def stats(self) -> {str: float}:
+        """
+        :return drift statistics since the last reset: number of wake ups, skipped ticks,
+                mean and max drift and jitter (drift standard deviation), in milliseconds
+        """
+        jitter = 0.0
+        if self.steps > 1:
+            jitter = math.sqrt(self._drift_m2 / (self.steps - 1))
+        return {
+            "steps": self.steps,
+            "skipped": self.skipped,
+            "drift_mean": self._drift_mean / 1e6,
+            "drift_max": self._drift_max / 1e6,
+            "jitter": jitter / 1e6,
+        }
@@ -0,0 +1,84 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+
+import struct
+
+
+def vlq(value: int) -> bytes:
+    """
+    encode a MIDI variable length quantity
+
+    >>> vlq(0x40).hex(), vlq(0x80).hex(), vlq(0x0FFFFFFF).hex()
+    ('40', '8100', 'ffffff7f')
+    """
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+class MidiFileWriter:
+    """
+    minimal Standard MIDI File writer (format 0, a single track)
+
+    messages are collected with their timestamp in seconds and converted to ticks
+    against a fixed tempo when the file is written
+    """
+
+    def __init__(self, bpm: float = 120, ticks_per_beat: int = 480):
+        self.bpm = bpm
+        self.ticks_per_beat = ticks_per_beat
+        self._messages = []
+
+    def __len__(self):
+        return len(self._messages)
+
+    def add(self, time: float, message: (int,)):
+        """
+        :param time: message timestamp, in seconds from the start of the track
+        :param message: channel message bytes (status first)
+        """
+        self._messages.append((time, len(self._messages), bytes(message)))
+
+    def to_ticks(self, time: float) -> int:
+        return int(round(time * self.ticks_per_beat * self.bpm / 60))
+
+    def track_data(self) -> bytes:
+        tempo = int(round(60000000 / self.bpm))
+        data = bytearray(b"\x00\xff\x51\x03" + tempo.to_bytes(3, "big"))
+        last_tick = 0
+        running_status = None
+        # sort by time, keeping insertion order for simultaneous messages
+        for time, _, message in sorted(self._messages):
+            tick = max(last_tick, self.to_ticks(time))
+            data += vlq(tick - last_tick)
+            last_tick = tick
+            if message[0] == running_status:
+                data += message[1:]
+            else:
+                data += message
+                running_status = message[0]
+        data += b"\x00\xff\x2f\x00"
+        return bytes(data)
+
+    def to_bytes(self) -> bytes:
+        track = self.track_data()
+        return (
+            b"MThd"
+            + struct.pack(">IHHH", 6, 0, 1, self.ticks_per_beat)
+            + b"MTrk"
+            + struct.pack(">I", len(track))
+            + track
+        )
+
+    def write(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.to_bytes())
@@ -0,0 +1,79 @@
+# coding=utf-8
+# Copyright (C) 2021 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Playpoint to note and control mappings
+
+the renderers (see eventrenderer) map playpoints through the lookup tables built here,
+this module doesn't depend on GTK, so the headless engine can use it too
+"""
+
+from .event import Note, ControlValue
+
+# diatonic scales, as intervals from the fundamental
+SCALES = {
+    "minor pentatonic": [Note(0), Note(3), Note(5), Note(7), Note(10)],
+    "major pentatonic": [Note(0), Note(2), Note(4), Note(7), Note(9)],
+    "major": [Note(0), Note(2), Note(4), Note(5), Note(7), Note(9), Note(11)],
+    "minor natural": [Note(0), Note(2), Note(3), Note(5), Note(7), Note(8), Note(10)],
+    "minor harmonic": [Note(0), Note(2), Note(3), Note(5), Note(7), Note(8), Note(11)],
+}
+
+
+class LookupTable:
+    """
+    precomputed output of a quantized mapping, indexed by percent input value (0~1)
+
+    the 0~1 range is scaled to the table indexes, truncating or rounding them, the
+    tables built here are the only definition of the renderer mappings
+    """
+
+    def __init__(self, values: list, rounding: bool = False):
+        self.values = values
+        self.rounding = rounding
+        self._last = len(values) - 1
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, val: float):
+        i = val * self._last
+        i = int(round(i, 0)) if self.rounding else int(i)
+        return self.values[min(max(i, 0), self._last)]
+
+
+def chromatic_table(minnote: Note, maxnote: Note) -> LookupTable:
+    """
+    map the 0~1 range to all the notes between minnote and maxnote (truncating)
+    """
+    span = (maxnote - minnote).note
+    return LookupTable([minnote + i for i in range(span + 1)])
+
+
+def diatonic_table(fundamental: Note, octaves: int, scale: [Note]) -> LookupTable:
+    """
+    map the 0~1 range to the notes of scale over octaves octaves from fundamental
+    (rounding to the nearest)
+    :param scale: scale intervals, relative to the fundamental
+    """
+    return LookupTable(
+        [
+            fundamental + scale[trasl % len(scale)].note + (int(trasl / len(scale)) * 12)
+            for trasl in range(int(octaves) * len(scale))
+        ],
+        rounding=True,
+    )
+
+
+def control_table(control: int, minval: int, maxval: int) -> LookupTable:
+    """
+    map the 0~1 range to the values of control between minval and maxval (truncating)
+    """
+    lower, upper = sorted((int(minval), int(maxval)))
+    return LookupTable(
+        [ControlValue.get(int(control), v) for v in range(lower, upper + 1)]
+    )
@@ -0,0 +1,105 @@
+# coding=utf-8
+# Copyright (C) 2022 by Marco Melletti <mellotanica@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+
+import threading
+
+from .event import Event
+
+
+class EventTimeline:
+    """
+    per column cache of the events produced by a consumer
+
+    the cache is bound to a key (analysis settings and frame geometry), when the key
+    changes the whole timeline is dropped, while canvas edits only drop the touched columns
+
+    each invalidation bumps the generation counter, events computed from data read before
+    an invalidation are discarded instead of being stored
+    """
+
+    def __init__(self):
+        self._events = {}
+        self._key = None
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.dirty = True
+
+    def __len__(self):
+        return len(self._events)
+
+    def __contains__(self, column):
+        return column in self._events
+
+    def validate(self, key):
+        """
+        drop all the cached events if the key changed
+        :param key: any value comparable with ==, describing what the events depend on
+        """
+        with self._lock:
+            if key != self._key:
+                self._key = key
+                self._clear()
+
+    def _clear(self):
+        self._events.clear()
+        self.generation += 1
+        self.dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def invalidate(self, x, w):
+        """
+        drop the cached events of a range of columns
+        :param x: first column
+        :param w: number of columns, if <= 0 the whole timeline is dropped
+        """
+        with self._lock:
+            if w <= 0:
+                self._clear()
+                return
+            if w < len(self._events):
+                for column in range(x, x + w):
+                    self._events.pop(column, None)
+            else:
+                for column in [c for c in self._events if x <= c < x + w]:
+                    del self._events[column]
+            self.generation += 1
+            self.dirty = True
+
+    def get(self, column) -> Event:
+        """
+        :return the cached event for column, None if it must be (re)analyzed
+        """
+        return self._events.get(column)
+
+    def store(self, column, event: Event, generation):
+        """
+        cache an event
+        :param generation: the timeline generation read before fetching the analyzed data
+        """
+        with self._lock:
+            if generation == self.generation:
+                self._events[column] = event
+
+    def missing(self, columns) -> [int]:
+        """
+        :return the columns among the requested ones that have no cached event
+        """
+        with self._lock:
+            return [c for c in columns if c not in self._events]
+
+    def mark_clean(self, generation):
+        """
+        flag the timeline as complete, if nothing was invalidated since generation
+        """
+        with self._lock:
+            if generation == self.generation:
+                self.dirty = False
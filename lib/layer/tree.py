@@ -585,11 +585,13 @@ class RootLayerStack (group.LayerStack):
             pixbuf = helpers.scale_proportionally(pixbuf, size, size)
         return pixbuf
 
-    def render_layer_as_pixbuf(self, layer, bbox=None, **options):
+    def render_layer_as_pixbuf(self, layer, bbox=None, mipmap_level=0,
+                               **options):
         """Render a layer as a GdkPixbuf.
 
         :param lib.layer.core.LayerBase layer: The layer to preview.
         :param tuple bbox: Rectangle to render (x, y, w, h).
+        :param int mipmap_level: downscale degree.
         :param **options: Passed to render().
         :rtype: GdkPixbuf.Pixbuf
 
@@ -597,16 +599,23 @@ class RootLayerStack (group.LayerStack):
         stack itself.
 
         The "bbox" parameter defaults to the natural data bounding box
-        of "layer", and has a minimum size of one tile.
+        of "layer", and has a minimum size of one tile. An explicit
+        "bbox" is in the coordinates of "mipmap_level", i.e. model
+        coordinates divided by 2**mipmap_level.
 
         """
         x, y, w, h = self._validate_layer_bbox_arg(layer, bbox)
+        if bbox is None and mipmap_level > 0:
+            x >>= mipmap_level
+            y >>= mipmap_level
+            w = max(1, w >> mipmap_level)
+            h = max(1, h >> mipmap_level)
         spec = self._get_render_spec_for_layer(layer)
 
         surface = lib.pixbufsurface.Surface(x, y, w, h)
         surface.pixbuf.fill(0x00000000)
         tiles = list(surface.get_tiles())
-        self.render(surface, tiles, 0, spec=spec, **options)
+        self.render(surface, tiles, mipmap_level, spec=spec, **options)
 
         pixbuf = surface.pixbuf
         assert pixbuf.get_width() == w
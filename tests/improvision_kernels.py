@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+# Imports:
+
+from __future__ import division, print_function
+import colorsys
+import unittest
+
+import numpy as np
+
+from . import paths
+from gui.improvision.kernels import luma_playpoints, range_playpoints, range_params
+from gui.improvision.scanline import ScanlineFrame
+from gui.improvision.utils import map_to_percent
+
+
+# Helpers:
+
+def _reference_playpoints(column, match):
+    """Per pixel loop of the original ColorConsumer.process_data()
+
+    The run touching the bottom of the column is closed too.
+
+    :param column: list of rgb tuples
+    :param match: function of an rgb tuple returning (in_range, x, y)
+    :return [height playpoints, x playpoints, y playpoints]
+    """
+    playpoints = [[], [], []]
+    window = [0, 0, 0]
+    windowsize = 0
+    maxv = len(column)
+    for y in range(maxv + 1):
+        matched, xv, yv = match(column[y]) if y < maxv else (False, 0, 0)
+        if matched:
+            window[0] += y
+            window[1] += xv
+            window[2] += yv
+            windowsize += 1
+        elif windowsize > 0:
+            playpoints[0].append(1 - ((window[0] / windowsize) / maxv))
+            playpoints[1].append(window[1] / windowsize)
+            playpoints[2].append(window[2] / windowsize)
+            window = [0, 0, 0]
+            windowsize = 0
+    return playpoints
+
+
+def _random_column(palette, size, seed):
+    rng = np.random.RandomState(seed)
+    return [palette[i] for i in rng.randint(0, len(palette), size)]
+
+
+# Test cases:
+
+class LumaPlaypoints (unittest.TestCase):
+    """Vectorized luma detector against the per pixel loop"""
+
+    # luma values are kept away from the 0.2~0.6 bounds
+    PALETTE = [
+        (1.0, 1.0, 1.0),
+        (0.0, 0.0, 0.0),
+        (0.5, 0.5, 0.5),
+        (1.0, 0.0, 0.0),
+        (0.0, 0.0, 1.0),
+        (0.3, 0.4, 0.3),
+    ]
+
+    def _check(self, column, minluma, maxluma):
+        def match(rgb):
+            lo, hi = sorted((minluma, maxluma))
+            luma = 0.299 * rgb[0] + 0.587 * rgb[1] + 0.114 * rgb[2]
+            return lo <= luma <= hi, 0, 0
+
+        expected = _reference_playpoints(column, match)[:1]
+        frame = ScanlineFrame(np.array(column, dtype=np.float32))
+        result = luma_playpoints(frame, minluma, maxluma)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(len(result[0]), len(expected[0]))
+        np.testing.assert_allclose(result[0], expected[0], rtol=1e-6)
+
+    def test_random_columns(self):
+        for seed in range(20):
+            self._check(_random_column(self.PALETTE, 97, seed), 0.2, 0.6)
+
+    def test_swapped_bounds(self):
+        self._check(_random_column(self.PALETTE, 50, 1), 0.6, 0.2)
+
+    def test_edges(self):
+        grey = (0.5, 0.5, 0.5)
+        white = (1.0, 1.0, 1.0)
+        self._check([grey] * 10, 0.2, 0.6)
+        self._check([white] * 10, 0.2, 0.6)
+        self._check([grey, white, white, grey], 0.2, 0.6)
+
+
+class RangePlaypoints (unittest.TestCase):
+    """Vectorized color range detector against the per pixel loop"""
+
+    # hues, saturations and values are kept away from the range bounds
+    PALETTE = [
+        (1.0, 0.0, 0.0),
+        (0.5, 0.1, 0.1),
+        (0.9, 0.3, 0.3),
+        (1.0, 0.6, 0.6),
+        (1.0, 0.5, 0.0),
+        (0.0, 1.0, 0.0),
+        (0.1, 0.0, 0.0),
+        (1.0, 1.0, 1.0),
+    ]
+
+    def _check(self, colorrange, column, convert):
+        params = range_params(colorrange)
+
+        def match(rgb):
+            color = convert(*rgb)
+            x = color[params["xid"]]
+            y = color[params["yid"]]
+            if (
+                abs(color[params["refid"]] - params["target"]) < params["targetdelta"]
+                and params["xmin"] <= x <= params["xmax"]
+                and params["ymin"] <= y <= params["ymax"]
+            ):
+                return (
+                    True,
+                    map_to_percent(params["xmin"], params["xmax"], x),
+                    map_to_percent(params["ymin"], params["ymax"], y),
+                )
+            return False, 0, 0
+
+        expected = _reference_playpoints(column, match)
+        frame = ScanlineFrame(np.array(column, dtype=np.float32))
+        result = range_playpoints(frame, **params)
+        self.assertEqual(len(result), 3)
+        for res, exp in zip(result, expected):
+            self.assertEqual(len(res), len(exp))
+            np.testing.assert_allclose(res, exp, rtol=1e-5, atol=1e-6)
+
+    def test_hsv_range(self):
+        colorrange = {
+            "type": "HSV",
+            "refval": "hue",
+            "target": 0,
+            "targetdelta": 0.05,
+            "xref": "saturation",
+            "xmin": 0.5,
+            "xmax": 1,
+            "ymin": 0.3,
+            "ymax": 1,
+        }
+        for seed in range(20):
+            column = _random_column(self.PALETTE, 97, seed)
+            self._check(colorrange, column, colorsys.rgb_to_hsv)
+
+    def test_rgb_range(self):
+        colorrange = {
+            "type": "RGB",
+            "refval": "red",
+            "target": 1,
+            "targetdelta": 0.15,
+            "xref": "blue",
+            "xmin": 0,
+            "xmax": 0.7,
+            "ymin": 0,
+            "ymax": 0.8,
+        }
+        for seed in range(20):
+            column = _random_column(self.PALETTE, 97, seed)
+            self._check(colorrange, column, lambda r, g, b: (r, g, b))
+
+
+if __name__ == "__main__":
+    unittest.main()
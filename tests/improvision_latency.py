@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+# Imports:
+
+from __future__ import division, print_function
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from . import paths
+from gui.improvision.latency import LatencyRecorder
+
+
+# Helpers:
+
+MS = 1000000
+
+
+# Test cases:
+
+class Recorder (unittest.TestCase):
+    """Stage timings ring buffers, percentiles and CSV dump"""
+
+    def test_percentiles(self):
+        recorder = LatencyRecorder()
+        durations = np.random.RandomState(0).randint(1, 20 * MS, 1000)
+        for i, duration in enumerate(durations):
+            recorder.record("render", i * 20 * MS, i * 20 * MS + int(duration))
+        np.testing.assert_allclose(
+            recorder.percentiles("render"),
+            np.percentile(durations, (50, 95, 99)) / 1e6,
+        )
+        self.assertEqual(recorder.percentiles("play"), [None, None, None])
+
+    def test_summary(self):
+        recorder = LatencyRecorder()
+        for i in range(1, 101):
+            recorder.record("step", 0, i * MS)
+        summary = recorder.summary()
+        # stages without samples are left out
+        self.assertEqual(list(summary), ["step"])
+        stats = summary["step"]
+        self.assertEqual(stats["count"], 100)
+        self.assertAlmostEqual(stats["p50"], 50.5)
+        self.assertAlmostEqual(stats["p99"], 99.01)
+        self.assertEqual(stats["max"], 100.0)
+
+    def test_ring(self):
+        recorder = LatencyRecorder(size=4)
+        for i in range(6):
+            recorder.record("process", i, i + 10 * i)
+        start, duration = recorder.samples("process")
+        # only the newest samples are kept, oldest first
+        self.assertEqual(start.tolist(), [2, 3, 4, 5])
+        self.assertEqual(duration.tolist(), [20, 30, 40, 50])
+        recorder.clear()
+        self.assertEqual(len(recorder.samples("process")[0]), 0)
+
+    def test_measure(self):
+        recorder = LatencyRecorder()
+        with self.assertRaises(ValueError):
+            with recorder.measure("renderer"):
+                raise ValueError
+        # the failed run is recorded too
+        start, duration = recorder.samples("renderer")
+        self.assertEqual(len(start), 1)
+        self.assertGreaterEqual(duration[0], 0)
+
+    def test_dump_csv(self):
+        recorder = LatencyRecorder()
+        recorder.record("play", 30, 35)
+        recorder.record("step", 10, 12)
+        recorder.record("render", 20, 29)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filename = os.path.join(tmpdir, "latency.csv")
+        recorder.dump_csv(filename)
+        with open(filename, newline="") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(
+            rows,
+            [
+                ["stage", "start_ns", "duration_ns"],
+                ["step", "10", "2"],
+                ["render", "20", "9"],
+                ["play", "30", "5"],
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+# Imports:
+
+from __future__ import division, print_function
+import time
+import unittest
+
+from . import paths
+from gui.improvision.event import Event, Note, ControlValue, ProgramChange
+from gui.improvision.midibackend import get_backend
+from gui.improvision.output import PortMidiPlayer, get_outputs
+
+
+# Helpers:
+
+CHANNEL = 2
+NOTE_ON = 0x90 + CHANNEL - 1
+NOTE_OFF = 0x80 + CHANNEL - 1
+CC = 0xB0 + CHANNEL - 1
+PC = 0xC0 + CHANNEL - 1
+
+
+# Test cases:
+
+class MidiOutputPlayerDiff (unittest.TestCase):
+    """Messages reaching the memory backend for a scripted sequence of events"""
+
+    def setUp(self):
+        self.memory = get_backend("memory").open(0)
+        self.player = PortMidiPlayer(CHANNEL, 0, backend="memory")
+        self.memory.take()
+
+    def tearDown(self):
+        self.player.stop()
+        self._take()
+
+    def _wait(self, count, timeout=1.0):
+        """Wait for count messages to be written
+
+        the output thread writes asynchronously
+        """
+        deadline = time.monotonic() + timeout
+        while len(self.memory.messages) < count and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    def _take(self, count=0):
+        """Messages written so far, waiting for at least count of them"""
+        self._wait(count)
+        return [m for _t, m in self.memory.take()]
+
+    def _play(self, *args, **kwargs):
+        self.player.play(Event(*args, **kwargs))
+
+    def test_notes(self):
+        self._play([Note(60), Note(64)])
+        self.assertEqual(self._take(2), [(NOTE_ON, 60, 127), (NOTE_ON, 64, 127)])
+
+        # 60 keeps sounding, 64 stops, 67 starts: note offs come first
+        self._play([Note(60), Note(67)])
+        self.assertEqual(self._take(2), [(NOTE_OFF, 64, 0), (NOTE_ON, 67, 127)])
+        self.assertEqual(self.player.active_notes, {Note(60), Note(67)})
+
+        self._play([])
+        self.assertEqual(
+            sorted(self._take(2)), [(NOTE_OFF, 60, 0), (NOTE_OFF, 67, 0)]
+        )
+        self.assertEqual(self.player.active_notes, set())
+
+    def test_repeated_event(self):
+        self._play([Note(60)], [ControlValue(7, 100)])
+        self.assertEqual(self._take(2), [(NOTE_ON, 60, 127), (CC, 7, 100)])
+        suppressed = self.player.suppressed
+        self._play([Note(60)], [ControlValue(7, 100)])
+        self.assertEqual(self.player.suppressed, suppressed + 2)
+        # nothing was sent for the repeated event
+        self._play([Note(62)])
+        self.assertEqual(self._take(2), [(NOTE_OFF, 60, 0), (NOTE_ON, 62, 127)])
+
+    def test_velocity(self):
+        self._play([Note(60, velocity=90)])
+        self.assertEqual(self._take(1), [(NOTE_ON, 60, 90)])
+
+    def test_controls(self):
+        self._play(controls=[ControlValue(1, 10), ControlValue(7, 100)])
+        self.assertEqual(self._take(2), [(CC, 1, 10), (CC, 7, 100)])
+        # only the control that changed is sent
+        self._play(controls=[ControlValue(1, 10), ControlValue(7, 90)])
+        self.assertEqual(self._take(1), [(CC, 7, 90)])
+        # controls keep their value when an event doesn't set them
+        self._play(controls=[ControlValue(7, 90)])
+        self._play(controls=[ControlValue(1, 11)])
+        self.assertEqual(self._take(1), [(CC, 1, 11)])
+
+    def test_program(self):
+        self._play(program=ProgramChange(5))
+        self.assertEqual(self._take(1), [(PC, 5)])
+        self._play(program=ProgramChange(5))
+        self._play(program=ProgramChange(6))
+        self.assertEqual(self._take(1), [(PC, 6)])
+
+    def test_stop(self):
+        self._play([Note(60), Note(72)])
+        self._take(2)
+        self.player.stop()
+        self.assertEqual(
+            sorted(self._take(2)), [(NOTE_OFF, 60, 0), (NOTE_OFF, 72, 0)]
+        )
+        self.player.stop()
+        self._play([Note(72)])
+        self.assertEqual(self._take(1), [(NOTE_ON, 72, 127)])
+
+    def test_single_batch(self):
+        self._play([Note(60)], [ControlValue(7, 100)], ProgramChange(3))
+        self._take(3)
+        self._play([Note(62)], [ControlValue(7, 90)])
+        self._wait(3)
+        batch = self.memory.take()
+        self.assertEqual(len(batch), 3)
+        # all the messages of a step are written together
+        self.assertEqual(len({t for t, _m in batch}), 1)
+
+
+class OutputStats (unittest.TestCase):
+    """Queue and send counters of the output threads"""
+
+    def test_stats(self):
+        player = PortMidiPlayer(CHANNEL, 0, backend="memory")
+        output = get_outputs()[("memory", 0)]
+        self.assertIs(output, player.output)
+        sent = output.stats()["sent"]
+        player.play(Event([Note(60)]))
+        player.stop()
+        deadline = time.monotonic() + 1
+        while output.stats()["sent"] < sent + 2 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        stats = output.stats()
+        self.assertEqual(stats["sent"], sent + 2)
+        self.assertEqual(stats["dropped"], 0)
+        self.assertGreaterEqual(stats["latency_max"], stats["latency_mean"])
+        self.assertGreaterEqual(stats["max_depth"], stats["depth"])
+        get_backend("memory").open(0).take()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+
+# Imports:
+
+from __future__ import division, print_function
+import threading
+import time
+import unittest
+
+from . import paths
+from gui.improvision.pipeline import FrameRing, LookaheadBuffer
+
+
+# Helpers:
+
+TIMEOUT = 5
+
+
+class _Consumer:
+    """Records the items it consumes, holding each one until released"""
+
+    def __init__(self, input_policy="block", hold=False):
+        self.enabled = True
+        self.input_policy = input_policy
+        self.items = []
+        self.started = threading.Semaphore(0)
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+        self.lock = threading.Lock()
+
+    def consume(self, item):
+        self.started.release()
+        self.release.wait(TIMEOUT)
+        with self.lock:
+            self.items.append(item)
+
+    def wait_items(self, count):
+        deadline = time.monotonic() + TIMEOUT
+        while len(self.items) < count and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return list(self.items)
+
+
+def _wait_idle(reader):
+    deadline = time.monotonic() + TIMEOUT
+    while (reader.busy or reader.stats()["pending"]) and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+# Test cases:
+
+class Lookahead (unittest.TestCase):
+    """Columns analyzed ahead of the scanline"""
+
+    def test_take(self):
+        buf = LookaheadBuffer(4)
+        buf.put(10, ["a"], buf.generation)
+        self.assertIn(10, buf)
+        self.assertEqual(buf.take(10), ["a"])
+        self.assertNotIn(10, buf)
+        self.assertIsNone(buf.take(10))
+        self.assertEqual((buf.hits, buf.misses), (1, 1))
+
+    def test_bounded(self):
+        buf = LookaheadBuffer(2)
+        for column in (1, 2, 3):
+            buf.put(column, [column], buf.generation)
+        # the oldest column is dropped
+        self.assertEqual(len(buf), 2)
+        self.assertNotIn(1, buf)
+        buf.resize(1)
+        self.assertEqual(len(buf), 1)
+        self.assertIn(3, buf)
+
+    def test_invalidate(self):
+        buf = LookaheadBuffer(8)
+        for column in range(5):
+            buf.put(column, [column], buf.generation)
+        buf.invalidate(1, 2)
+        self.assertEqual(sorted(c for c in range(5) if c in buf), [0, 3, 4])
+        buf.invalidate(0, 0)
+        self.assertEqual(len(buf), 0)
+
+    def test_stale_generation(self):
+        buf = LookaheadBuffer(4)
+        generation = buf.generation
+        # an edit lands while the column is being analyzed
+        buf.invalidate(10, 1)
+        buf.put(10, ["stale"], generation)
+        self.assertNotIn(10, buf)
+        buf.put(10, ["fresh"], buf.generation)
+        self.assertEqual(buf.take(10), ["fresh"])
+
+    def test_retain(self):
+        buf = LookaheadBuffer(4)
+        for column in range(4):
+            buf.put(column, [column], buf.generation)
+        buf.retain([2, 3, 4])
+        self.assertEqual(sorted(c for c in range(5) if c in buf), [2, 3])
+
+    def test_put_wakes_waiters(self):
+        buf = LookaheadBuffer(4)
+        timer = threading.Timer(0.05, buf.put, (7, ["a"], buf.generation))
+        timer.start()
+        start = time.monotonic()
+        while 7 not in buf and time.monotonic() - start < 5:
+            buf.wait(timeout=5)
+        timer.join()
+        self.assertIn(7, buf)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class Ring (unittest.TestCase):
+    """Broadcast of the scanline frames to the consumers"""
+
+    def test_order(self):
+        ring = FrameRing(size=4, workers=3)
+        ring.start()
+        consumers = [_Consumer() for _ in range(3)]
+        for c in consumers:
+            ring.attach(c)
+        for i in range(100):
+            ring.publish(i)
+        # every consumer sees every item, in order
+        for c in consumers:
+            self.assertEqual(c.wait_items(100), list(range(100)))
+
+    def test_parallel_consumers(self):
+        ring = FrameRing(workers=2)
+        ring.start()
+        slow = _Consumer(hold=True)
+        fast = _Consumer()
+        ring.attach(slow)
+        ring.attach(fast)
+        ring.publish("a")
+        self.assertTrue(slow.started.acquire(timeout=TIMEOUT))
+        # a busy consumer doesn't hold back the others
+        ring.publish("b")
+        self.assertEqual(fast.wait_items(2), ["a", "b"])
+        self.assertEqual(slow.items, [])
+        slow.release.set()
+        self.assertEqual(slow.wait_items(2), ["a", "b"])
+
+    def test_attach_receives_new_items(self):
+        ring = FrameRing()
+        ring.start()
+        ring.publish("old")
+        consumer = _Consumer()
+        ring.attach(consumer)
+        ring.publish("new")
+        self.assertEqual(consumer.wait_items(1), ["new"])
+
+    def test_detach(self):
+        ring = FrameRing(workers=2)
+        ring.start()
+        consumer = _Consumer(hold=True)
+        other = _Consumer()
+        reader = ring.attach(consumer)
+        ring.attach(other)
+        ring.publish(1)
+        self.assertTrue(consumer.started.acquire(timeout=TIMEOUT))
+        timer = threading.Timer(0.05, consumer.release.set)
+        timer.start()
+        # detach waits for the item being consumed
+        reader.detach()
+        self.assertEqual(consumer.items, [1])
+        ring.publish(2)
+        self.assertEqual(other.wait_items(2), [1, 2])
+        self.assertEqual(consumer.items, [1])
+        timer.join()
+
+
+class RingPolicies (unittest.TestCase):
+    """Consumers falling behind the producer"""
+
+    def _behind(self, policy, size, count):
+        """Publish count items while the consumer holds the first one
+
+        :return (ring, consumer, reader)
+        """
+        ring = FrameRing(size=size, workers=1)
+        ring.start()
+        consumer = _Consumer(policy, hold=True)
+        reader = ring.attach(consumer)
+        ring.publish(0)
+        self.assertTrue(consumer.started.acquire(timeout=TIMEOUT))
+        for i in range(1, count):
+            ring.publish(i)
+        return ring, consumer, reader
+
+    def test_latest(self):
+        ring, consumer, reader = self._behind("latest", 8, 6)
+        consumer.release.set()
+        self.assertEqual(consumer.wait_items(2), [0, 5])
+        _wait_idle(reader)
+        self.assertEqual(
+            reader.stats(),
+            {"pending": 0, "processed": 2, "dropped": 0, "coalesced": 4},
+        )
+
+    def test_bounded(self):
+        ring, consumer, reader = self._behind("bounded", 4, 7)
+        consumer.release.set()
+        # the ring overwrote items 1 and 2
+        self.assertEqual(consumer.wait_items(5), [0, 3, 4, 5, 6])
+        _wait_idle(reader)
+        self.assertEqual(
+            reader.stats(),
+            {"pending": 0, "processed": 5, "dropped": 2, "coalesced": 0},
+        )
+
+    def test_block(self):
+        ring, consumer, reader = self._behind("block", 2, 3)
+        publisher = threading.Thread(target=ring.publish, args=(3,))
+        publisher.start()
+        publisher.join(0.1)
+        # the ring is full, the producer waits for the consumer
+        self.assertTrue(publisher.is_alive())
+        consumer.release.set()
+        publisher.join(TIMEOUT)
+        self.assertFalse(publisher.is_alive())
+        self.assertEqual(consumer.wait_items(4), [0, 1, 2, 3])
+        _wait_idle(reader)
+        self.assertEqual(reader.stats()["dropped"], 0)
+
+    def test_disabled_doesnt_block(self):
+        ring = FrameRing(size=2, workers=1)
+        ring.start()
+        consumer = _Consumer("block", hold=True)
+        consumer.enabled = False
+        ring.attach(consumer)
+        publisher = threading.Thread(target=lambda: [ring.publish(i) for i in range(5)])
+        publisher.start()
+        publisher.join(TIMEOUT)
+        self.assertFalse(publisher.is_alive())
+        self.assertFalse(consumer.started.acquire(timeout=0.05))
+        consumer.release.set()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+# Imports:
+
+from __future__ import division, print_function
+import colorsys
+import itertools
+import unittest
+
+import numpy as np
+
+from . import paths
+from gui.improvision.scanline import (
+    ScanlineFrame,
+    band_spans,
+    reduce_band,
+    rgb_to_hsv,
+)
+
+
+# Helpers:
+
+def _columns(spans):
+    return [x for start, count in spans for x in range(start, start + count)]
+
+
+def _hue_distance(a, b):
+    d = np.abs(a - b)
+    return np.minimum(d, 1 - d)
+
+
+# Test cases:
+
+class RGBToHSV (unittest.TestCase):
+    """Vectorized conversion against colorsys"""
+
+    def _check(self, rgb):
+        rgb = np.asarray(rgb, dtype=np.float32)
+        result = rgb_to_hsv(rgb)
+        self.assertEqual(result.shape, rgb.shape)
+        self.assertEqual(result.dtype, np.float32)
+        expected = np.array(
+            [colorsys.rgb_to_hsv(*c) for c in rgb.astype(np.float64)]
+        )
+        # hue wraps around, 0 and 1 are the same
+        self.assertLess(_hue_distance(result[:, 0], expected[:, 0]).max(), 1e-5)
+        np.testing.assert_allclose(result[:, 1:], expected[:, 1:], atol=1e-6)
+
+    def test_grid(self):
+        # greys, primaries and ties between the max channels
+        steps = [0.0, 0.25, 0.5, 0.75, 1.0]
+        self._check(list(itertools.product(steps, repeat=3)))
+
+    def test_random(self):
+        self._check(np.random.RandomState(0).random_sample((10000, 3)))
+
+    def test_single_color(self):
+        result = rgb_to_hsv((1.0, 0.5, 0.0))
+        np.testing.assert_allclose(
+            result, colorsys.rgb_to_hsv(1.0, 0.5, 0.0), atol=1e-6
+        )
+
+
+class BandSpans (unittest.TestCase):
+    """Columns swept by the scanline between two steps"""
+
+    def test_single_step(self):
+        self.assertEqual(band_spans(None, 5, 10), [(5, 1)])
+        self.assertEqual(band_spans(4, 5, 10), [(5, 1)])
+        self.assertEqual(band_spans(5, 5, 10), [(5, 1)])
+
+    def test_coalesced_ticks(self):
+        # two stepinc=3 ticks merged into one: the band covers both
+        spans = band_spans(2, 8, 10)
+        self.assertEqual(spans, [(3, 6)])
+        self.assertEqual(_columns(spans), [3, 4, 5, 6, 7, 8])
+
+    def test_wrap(self):
+        spans = band_spans(8, 1, 10)
+        self.assertEqual(spans, [(9, 1), (0, 2)])
+        self.assertEqual(_columns(spans), [9, 0, 1])
+
+    def test_wrap_from_last_column(self):
+        self.assertEqual(band_spans(9, 1, 10), [(0, 2)])
+
+    def test_previous_past_frame(self):
+        # the frame shrank since the previous step
+        self.assertEqual(band_spans(12, 1, 10), [(0, 2)])
+
+    def test_reduce_wrapped_band(self):
+        rgb = np.ones((2, 10, 3), dtype=np.float32)
+        rgb[0, 9] = (0.2, 0.2, 0.2)
+        rgb[1, 0] = (0.0, 0.5, 0.0)
+        spans = band_spans(8, 1, 10)
+        block = ScanlineFrame(
+            np.concatenate([rgb[:, s:s + n] for s, n in spans], axis=1)
+        )
+        merged = reduce_band(block, "max").rgb
+        np.testing.assert_allclose(merged[0], (0.2, 0.2, 0.2))
+        np.testing.assert_allclose(merged[1], (0.0, 0.5, 0.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
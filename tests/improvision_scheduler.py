@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+# Imports:
+
+from __future__ import division, print_function
+import unittest
+from unittest import mock
+
+from . import paths
+from gui.improvision.scheduler import ScanlineClock
+
+
+# Helpers:
+
+MS = 1000000
+PERIOD = 0.01
+
+
+class _FakeTime:
+    """Monotonic clock that only advances when slept on"""
+
+    def __init__(self):
+        self.now = 0
+
+    def monotonic_ns(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(int(seconds * 1e9), 1000)
+
+
+class _Sleeper:
+    """threading.Event stand-in, oversleeping each wait by a fixed amount"""
+
+    def __init__(self, time, oversleep=0):
+        self.time = time
+        self.oversleep = oversleep
+        self.interrupted = False
+
+    def wait(self, timeout):
+        if self.interrupted:
+            return True
+        self.time.now += int(timeout * 1e9) + self.oversleep
+        return False
+
+    def is_set(self):
+        return self.interrupted
+
+
+# Test cases:
+
+class Clock (unittest.TestCase):
+    """Absolute grid deadlines and coalesced ticks"""
+
+    def setUp(self):
+        self.time = _FakeTime()
+        patcher = mock.patch("gui.improvision.scheduler.time", self.time)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock = ScanlineClock()
+
+    def test_on_time(self):
+        sleeper = _Sleeper(self.time)
+        for tick in range(1, 11):
+            self.assertEqual(self.clock.wait(PERIOD, sleeper), 1)
+            # the wake ups stay on the grid
+            self.assertLess(self.time.now - tick * 10 * MS, 2000)
+        self.assertEqual(self.clock.stats()["steps"], 10)
+        self.assertEqual(self.clock.skipped, 0)
+
+    def test_processing_not_added(self):
+        sleeper = _Sleeper(self.time)
+        self.clock.wait(PERIOD, sleeper)
+        # a step taking most of the period doesn't delay the next one
+        self.time.now += 7 * MS
+        self.assertEqual(self.clock.wait(PERIOD, sleeper), 1)
+        self.assertLess(self.time.now - 20 * MS, 2000)
+
+    def test_coalesced_ticks(self):
+        sleeper = _Sleeper(self.time)
+        self.clock.wait(PERIOD, sleeper)
+        # a step overrunning three and a half periods
+        self.time.now += 35 * MS
+        self.assertEqual(self.clock.wait(PERIOD, sleeper), 3)
+        self.assertEqual(self.clock.skipped, 2)
+        # back on the grid
+        self.assertEqual(self.clock.wait(PERIOD, sleeper), 1)
+        self.assertLess(self.time.now - 50 * MS, 2000)
+        stats = self.clock.stats()
+        self.assertEqual((stats["steps"], stats["skipped"]), (3, 2))
+
+    def test_interrupted(self):
+        sleeper = _Sleeper(self.time)
+        self.clock.wait(PERIOD, sleeper)
+        sleeper.interrupted = True
+        self.assertEqual(self.clock.wait(PERIOD, sleeper), 0)
+        self.assertEqual(self.clock.stats()["steps"], 1)
+        sleeper.interrupted = False
+        self.assertEqual(self.clock.wait(PERIOD, sleeper), 1)
+
+    def test_period_change(self):
+        sleeper = _Sleeper(self.time)
+        self.clock.wait(PERIOD, sleeper)
+        self.clock.wait(PERIOD, sleeper)
+        # the new pace starts from the current tick
+        self.assertEqual(self.clock.wait(PERIOD * 2, sleeper), 1)
+        self.assertLess(self.time.now - 40 * MS, 2000)
+
+    def test_drift(self):
+        sleeper = _Sleeper(self.time, oversleep=ScanlineClock.SPIN_NS + MS)
+        for _ in range(5):
+            self.clock.wait(PERIOD, sleeper)
+        stats = self.clock.stats()
+        self.assertAlmostEqual(stats["drift_mean"], 1.0)
+        self.assertAlmostEqual(stats["drift_max"], 1.0)
+        self.assertAlmostEqual(stats["jitter"], 0.0)
+
+    def test_reset(self):
+        sleeper = _Sleeper(self.time)
+        self.clock.wait(PERIOD, sleeper)
+        self.time.now += 35 * MS
+        self.clock.wait(PERIOD, sleeper)
+        self.clock.reset()
+        self.assertEqual(self.clock.stats()["skipped"], 0)
+        # the grid is anchored again on the next wait
+        self.assertEqual(self.clock.wait(PERIOD, sleeper), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+# Imports:
+
+from __future__ import division, print_function
+import os
+import struct
+import tempfile
+import unittest
+
+from . import paths
+from gui.improvision.event import Event, Note, ControlValue
+from gui.improvision.output import MidiFilePlayer
+from gui.improvision.smf import MidiFileWriter, vlq
+
+
+# Helpers:
+
+# data bytes following each channel message status
+DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+
+
+def read_vlq(data, i):
+    value = 0
+    while True:
+        value = (value << 7) | (data[i] & 0x7F)
+        i += 1
+        if data[i - 1] < 0x80:
+            return value, i
+
+
+def read_smf(data):
+    """Parse a format 0 Standard MIDI File
+
+    :return (ticks_per_beat, tempo, [(absolute tick, message)])
+    """
+    assert data[:4] == b"MThd"
+    length, fmt, ntracks, ticks_per_beat = struct.unpack(">IHHH", data[4:14])
+    assert (length, fmt, ntracks) == (6, 0, 1)
+    assert data[14:18] == b"MTrk"
+    (length,) = struct.unpack(">I", data[18:22])
+    track = data[22:]
+    assert len(track) == length
+
+    tempo = None
+    events = []
+    tick = 0
+    status = None
+    i = 0
+    while i < len(track):
+        delta, i = read_vlq(track, i)
+        tick += delta
+        if track[i] == 0xFF:
+            meta, size = track[i + 1], track[i + 2]
+            payload = track[i + 3 : i + 3 + size]
+            i += 3 + size
+            if meta == 0x51:
+                tempo = int.from_bytes(payload, "big")
+            elif meta == 0x2F:
+                assert i == len(track)
+            continue
+        if track[i] & 0x80:
+            status = track[i]
+            i += 1
+        size = DATA_LENGTHS[status & 0xF0]
+        events.append((tick, (status,) + tuple(track[i : i + size])))
+        i += size
+    return ticks_per_beat, tempo, events
+
+
+# Test cases:
+
+class MidiFileWriterRoundTrip (unittest.TestCase):
+    """Written files parsed back"""
+
+    def test_vlq(self):
+        for value in (0, 0x7F, 0x80, 0x3FFF, 0x4000, 0x0FFFFFFF):
+            data = vlq(value)
+            self.assertEqual(read_vlq(data, 0), (value, len(data)))
+
+    def test_round_trip(self):
+        writer = MidiFileWriter(bpm=100, ticks_per_beat=96)
+        messages = [
+            (0.0, (0x90, 60, 127)),
+            (0.0, (0x90, 64, 100)),
+            (0.3, (0xB0, 7, 90)),
+            (0.6, (0x80, 60, 0)),
+            (0.6, (0x80, 64, 0)),
+            (0.6, (0xC0, 5)),
+            (61.0, (0x91, 62, 127)),
+        ]
+        for t, m in messages:
+            writer.add(t, m)
+        self.assertEqual(len(writer), len(messages))
+
+        ticks_per_beat, tempo, events = read_smf(writer.to_bytes())
+        self.assertEqual(ticks_per_beat, 96)
+        self.assertEqual(tempo, 600000)
+        self.assertEqual(
+            events, [(writer.to_ticks(t), m) for t, m in messages]
+        )
+
+    def test_out_of_order(self):
+        writer = MidiFileWriter()
+        writer.add(1.0, (0x80, 60, 0))
+        writer.add(0.0, (0x90, 60, 127))
+        writer.add(1.0, (0x90, 62, 127))
+        _tpb, _tempo, events = read_smf(writer.to_bytes())
+        # sorted by time, simultaneous messages keep their order
+        self.assertEqual(
+            events,
+            [(0, (0x90, 60, 127)), (960, (0x80, 60, 0)), (960, (0x90, 62, 127))],
+        )
+
+    def test_write(self):
+        writer = MidiFileWriter()
+        writer.add(0.5, (0x90, 60, 127))
+        fd, filename = tempfile.mkstemp(suffix=".mid")
+        os.close(fd)
+        try:
+            writer.write(filename)
+            with open(filename, "rb") as f:
+                self.assertEqual(f.read(), writer.to_bytes())
+        finally:
+            os.remove(filename)
+
+    def test_player(self):
+        writer = MidiFileWriter(bpm=120, ticks_per_beat=480)
+        now = [0.0]
+        player = MidiFilePlayer(writer, lambda: now[0], channel=3)
+        player.play(Event([Note(60)], [ControlValue(1, 64)]))
+        now[0] = 0.5
+        player.play(Event([Note(62)]))
+        now[0] = 1.0
+        player.stop()
+        _tpb, _tempo, events = read_smf(writer.to_bytes())
+        self.assertEqual(
+            events,
+            [
+                (0, (0x92, 60, 127)),
+                (0, (0xB2, 1, 64)),
+                (480, (0x92, 62, 127)),
+                (480, (0x82, 60, 0)),
+                (960, (0x82, 62, 0)),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
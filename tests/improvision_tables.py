@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+# Imports:
+
+from __future__ import division, print_function
+import unittest
+
+from . import paths
+from gui.improvision.event import Note, ControlValue
+from gui.improvision.tables import (
+    SCALES,
+    chromatic_table,
+    diatonic_table,
+    control_table,
+)
+from gui.improvision.utils import map_to_range
+
+
+# Helpers:
+
+# input values, including the range ends and values close to the rounding points
+VALUES = [i / 1000 for i in range(1001)]
+
+
+def _chromatic_note(val, minnote, maxnote):
+    return minnote + int(val * (maxnote - minnote).note)
+
+
+def _diatonic_note(val, fundamental, octaves, scale):
+    trasl = int(round(val * ((octaves * len(scale)) - 1), 0))
+    scalenote = scale[trasl % len(scale)]
+    octave = int(trasl / len(scale))
+    return fundamental + scalenote.note + (octave * 12)
+
+
+def _control_value(val, control, minval, maxval):
+    return ControlValue(control, map_to_range(minval, maxval, val))
+
+
+# Test cases:
+
+class Tables (unittest.TestCase):
+    """Lookup tables against the per call mappings they replaced"""
+
+    def test_chromatic(self):
+        for minnote, maxnote in [(48, 72), (60, 61), (60, 60), (0, 127)]:
+            minnote, maxnote = Note(minnote), Note(maxnote)
+            table = chromatic_table(minnote, maxnote)
+            for val in VALUES:
+                self.assertEqual(
+                    table[val], _chromatic_note(val, minnote, maxnote), (minnote, val)
+                )
+
+    def test_diatonic(self):
+        fundamental = Note(48)
+        for name, scale in SCALES.items():
+            for octaves in (1, 2, 3):
+                table = diatonic_table(fundamental, octaves, scale)
+                for val in VALUES:
+                    self.assertEqual(
+                        table[val],
+                        _diatonic_note(val, fundamental, octaves, scale),
+                        (name, octaves, val),
+                    )
+
+    def test_control(self):
+        for minval, maxval in [(0, 127), (20, 40), (40, 20), (64, 64)]:
+            table = control_table(7, minval, maxval)
+            for val in VALUES:
+                self.assertEqual(
+                    table[val], _control_value(val, 7, minval, maxval), (minval, val)
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# Imports:
+
+from __future__ import division, print_function
+import unittest
+
+from . import paths
+from gui.improvision.event import Event, Note
+from gui.improvision.timeline import EventTimeline
+
+
+# Helpers:
+
+def _timeline(columns, key="key"):
+    timeline = EventTimeline()
+    timeline.validate(key)
+    for column in columns:
+        timeline.store(column, Event([Note(column)]), timeline.generation)
+    return timeline
+
+
+# Test cases:
+
+class Timeline (unittest.TestCase):
+    """Per column event cache and its invalidation"""
+
+    def test_store(self):
+        timeline = _timeline(range(3))
+        self.assertEqual(len(timeline), 3)
+        event = Event([Note(60)])
+        timeline.store(1, event, timeline.generation)
+        self.assertIs(timeline.get(1), event)
+        self.assertIsNone(timeline.get(3))
+        self.assertEqual(timeline.missing(range(5)), [3, 4])
+
+    def test_validate(self):
+        timeline = _timeline(range(3))
+        generation = timeline.generation
+        # the same key keeps the cached events
+        timeline.validate("key")
+        self.assertEqual(len(timeline), 3)
+        self.assertEqual(timeline.generation, generation)
+        timeline.validate("other")
+        self.assertEqual(len(timeline), 0)
+        self.assertGreater(timeline.generation, generation)
+        self.assertTrue(timeline.dirty)
+
+    def test_invalidate(self):
+        timeline = _timeline(range(10))
+        generation = timeline.generation
+        timeline.invalidate(2, 3)
+        self.assertEqual(timeline.missing(range(10)), [2, 3, 4])
+        self.assertGreater(timeline.generation, generation)
+        # a range wider than the cached columns
+        timeline.invalidate(6, 100)
+        self.assertEqual(timeline.missing(range(10)), [2, 3, 4, 6, 7, 8, 9])
+        timeline.invalidate(0, 0)
+        self.assertEqual(len(timeline), 0)
+
+    def test_stale_store(self):
+        timeline = _timeline([])
+        generation = timeline.generation
+        # an edit lands while the column is being analyzed
+        timeline.invalidate(5, 1)
+        timeline.store(5, Event([Note(60)]), generation)
+        self.assertNotIn(5, timeline)
+        # an edit elsewhere also discards the result
+        generation = timeline.generation
+        timeline.invalidate(20, 1)
+        timeline.store(5, Event([Note(60)]), generation)
+        self.assertNotIn(5, timeline)
+        timeline.store(5, Event([Note(60)]), timeline.generation)
+        self.assertIn(5, timeline)
+
+    def test_mark_clean(self):
+        timeline = _timeline(range(3))
+        self.assertTrue(timeline.dirty)
+        generation = timeline.generation
+        timeline.invalidate(1, 1)
+        # the pass started before the edit, the timeline stays dirty
+        timeline.mark_clean(generation)
+        self.assertTrue(timeline.dirty)
+        timeline.mark_clean(timeline.generation)
+        self.assertFalse(timeline.dirty)
+        timeline.clear()
+        self.assertTrue(timeline.dirty)
+        self.assertEqual(len(timeline), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()